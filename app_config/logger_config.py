@@ -1,12 +1,75 @@
+import atexit
+import json
 import logging
-from datetime import datetime
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"logs/bot_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import logging.handlers
+import multiprocessing
+import os
+import queue
+
+from app_config import CONFIG
+
+
+STRUCTURED_FIELDS = ("user_id", "product_id", "order_id")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage()
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def file_handler(log_dir: str) -> logging.Handler:
+    process_name = multiprocessing.current_process().name
+    file_name = "bot.log" if process_name == "MainProcess" else f"bot-{process_name}.log"
+    path = os.path.join(log_dir, file_name)
+    if CONFIG.get("LOG_ROTATION", "size") == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path,
+            when=CONFIG.get("LOG_ROTATE_WHEN", "midnight"),
+            backupCount=CONFIG.get("LOG_BACKUP_COUNT", 7),
+            encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=CONFIG.get("LOG_MAX_BYTES", 10 * 1024 * 1024),
+        backupCount=CONFIG.get("LOG_BACKUP_COUNT", 7),
+        encoding="utf-8"
+    )
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    log_dir = CONFIG.get("LOG_DIR", "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    if CONFIG.get("LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [file_handler(log_dir), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(CONFIG.get("LOG_LEVEL", "INFO"))
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = setup_logging()
 logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+
+from app_config import CONFIG
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Offline load test of the shop bot")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--provider", choices=("test", "yoomoney", "heleket"), default="heleket")
+    parser.add_argument("--pay-delay", type=float, default=0.5, help="seconds between the invoice and the payment")
+    parser.add_argument("--poll-delay", type=float, default=0.5, help="base payment polling delay")
+    parser.add_argument("--webhook", action="store_true", help="deliver Heleket payments through the signed webhook instead of polling")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds a user waits for each payment step")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep INFO logs")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, workdir: str):
+    CONFIG.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{workdir}/bench.sqlite3",
+        PRODUCTS_DIR=f"{workdir}/products",
+        LOG_DIR=f"{workdir}/logs",
+        BOT_TOKEN="42:bench",
+        ADMIN_ID=1,
+        CHANNEL_ID=-1000000000001,
+        DEBUG_MODE=args.provider == "test",
+        USE_YOOMONEY=args.provider == "yoomoney",
+        USE_HELEKET=args.provider == "heleket",
+        USE_HELEKET_WEBHOOK=args.webhook and args.provider == "heleket",
+        USE_TELEGRAM_WEBHOOK=False,
+        YOOMONEY_TOKEN="bench",
+        YOOMONEY_WALLET="4100000000000000",
+        HELEKET_MERCHANT_UUID="bench",
+        HELEKET_API_KEY="bench",
+        HTTP_RETRIES=0,
+        WORKERS=1
+    )
+
+
+def print_report(report: dict):
+    print(f"users: {report['users']}, purchases: {report['purchases']}, failures: {report['failures'] or 'none'}")
+    print(f"updates: {report['updates']} in {report['elapsed']:.2f}s ({report['updates_per_second']:.0f}/s)")
+    print("latency, ms:")
+    for step, latency in report["latency"].items():
+        print(f"  {step:<18} p50 {latency['p50']:8.2f}  p99 {latency['p99']:8.2f}")
+    calls_per_purchase = report["calls_per_purchase"]
+    print(f"outbound calls: {sum(report['calls'].values())}"
+          + (f" ({calls_per_purchase:.1f} per purchase)" if calls_per_purchase is not None else ""))
+    for name, count in sorted(report["calls"].items()):
+        print(f"  {name:<30} {count}")
+    print(f"db queries: {report['queries']} ({report['queries_per_update']:.2f} per update)")
+
+
+def main():
+    args = parse_args()
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(args, workdir)
+        from bench.scenario import Benchmark
+
+        report = asyncio.run(Benchmark(
+            users=args.users,
+            concurrency=args.concurrency,
+            products=args.products,
+            provider=args.provider,
+            pay_delay=args.pay_delay,
+            poll_delay=args.poll_delay,
+            timeout=args.timeout
+        ).run())
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
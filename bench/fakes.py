@@ -0,0 +1,211 @@
+from collections import Counter
+from datetime import datetime
+from aiohttp import web, ClientSession
+import asyncio
+import itertools
+import time
+
+from payment.webhook import sign_payload
+
+
+class FakeServer:
+    def __init__(self):
+        self.app = web.Application()
+        self.calls: Counter = Counter()
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1"):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host=host, port=0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+class FakeTelegram(FakeServer):
+    def __init__(self, username: str = "bench_shop_bot"):
+        super().__init__()
+        self.username = username
+        self.message_ids = itertools.count(1)
+        self.waiters: dict[int, list[tuple[str, asyncio.Future]]] = {}
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+
+    def wait_for(self, chat_id: int, *prefixes: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        for prefix in prefixes:
+            self.waiters.setdefault(chat_id, []).append((prefix, future))
+        return future
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = await request.post()
+        chat_id = int(data.get("chat_id", 0))
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": self.username}
+        elif method == "getchatmember":
+            result = {"status": "member", "user": {"id": int(data["user_id"]), "is_bot": False, "first_name": "User"}}
+        elif method == "getfile":
+            result = {"file_id": data["file_id"], "file_unique_id": data["file_id"], "file_path": f"documents/{data['file_id']}.zip"}
+        elif method in ("sendmessage", "senddocument", "editmessagereplymarkup"):
+            result = {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}
+            }
+            if method == "sendmessage":
+                result["text"] = data["text"]
+                self._notify(chat_id, data["text"])
+            if method == "senddocument":
+                result["document"] = {"file_id": f"file{result['message_id']}", "file_unique_id": f"file{result['message_id']}"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(self, request: web.Request) -> web.Response:
+        self.calls["download"] += 1
+        return web.Response(body=b"bench product " * 1024)
+
+    def _notify(self, chat_id: int, text: str):
+        waiters = self.waiters.get(chat_id)
+        if not waiters:
+            return
+        for prefix, future in list(waiters):
+            if text.startswith(prefix):
+                if not future.done():
+                    future.set_result(text)
+                waiters[:] = [waiter for waiter in waiters if waiter[1] is not future]
+        if not waiters:
+            del self.waiters[chat_id]
+
+
+class FakeHeleket(FakeServer):
+    def __init__(self, pay_delay: float, page_size: int = 100):
+        super().__init__()
+        self.pay_delay = pay_delay
+        self.page_size = page_size
+        self.orders: dict[str, dict] = {}
+        self.notifications: set[asyncio.Task] = set()
+        self.session: ClientSession | None = None
+        self.app.router.add_post("/v1/payment", self.create)
+        self.app.router.add_post("/v1/payment/info", self.info)
+        self.app.router.add_post("/v1/payment/list", self.list)
+        self.app.router.add_get("/v1/exchange-rate/{coin}/list", self.rates)
+
+    def pay(self, order_id: str):
+        order = self.orders.get(order_id)
+        if order is not None:
+            order["paid_at"] = time.monotonic() + self.pay_delay
+            if order["url_callback"]:
+                task = asyncio.create_task(self._notify(order))
+                self.notifications.add(task)
+                task.add_done_callback(self.notifications.discard)
+
+    async def stop(self):
+        for task in list(self.notifications):
+            task.cancel()
+        await asyncio.gather(*self.notifications, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+        await super().stop()
+
+    async def _notify(self, order: dict):
+        await asyncio.sleep(self.pay_delay)
+        payload = {
+            "type": "payment",
+            "uuid": order["order_id"],
+            "order_id": order["order_id"],
+            "amount": order["amount"],
+            "status": "paid"
+        }
+        payload["sign"] = sign_payload(payload)
+        if self.session is None:
+            self.session = ClientSession()
+        self.calls["webhook"] += 1
+        async with self.session.post(order["url_callback"], json=payload) as response:
+            if response.status != 200:
+                self.calls[f"webhook {response.status}"] += 1
+
+    def _status(self, order: dict) -> str:
+        return "paid" if order["paid_at"] is not None and order["paid_at"] <= time.monotonic() else "check"
+
+    async def create(self, request: web.Request) -> web.Response:
+        self.calls["payment"] += 1
+        payload = await request.json()
+        self.orders[payload["order_id"]] = {
+            "order_id": payload["order_id"],
+            "amount": payload["amount"],
+            "url_callback": payload.get("url_callback"),
+            "paid_at": None
+        }
+        return web.json_response({"state": 0, "result": {
+            "uuid": payload["order_id"],
+            "order_id": payload["order_id"],
+            "url": f"{self.url}/pay/{payload['order_id']}",
+            "status": "check"
+        }})
+
+    async def info(self, request: web.Request) -> web.Response:
+        self.calls["payment/info"] += 1
+        order = self.orders.get((await request.json())["order_id"])
+        return web.json_response({"state": 0, "result": {"status": self._status(order) if order else "cancel"}})
+
+    async def list(self, request: web.Request) -> web.Response:
+        self.calls["payment/list"] += 1
+        cursor = int(request.query.get("cursor", 0))
+        orders = list(reversed(self.orders.values()))
+        page = orders[cursor:cursor + self.page_size]
+        next_cursor = cursor + self.page_size if cursor + self.page_size < len(orders) else None
+        return web.json_response({"state": 0, "result": {
+            "items": [{"order_id": order["order_id"], "status": self._status(order)} for order in page],
+            "paginate": {"nextCursor": str(next_cursor) if next_cursor else None}
+        }})
+
+    async def rates(self, request: web.Request) -> web.Response:
+        self.calls["exchange-rate"] += 1
+        return web.json_response({"state": 0, "result": [
+            {"from": request.match_info["coin"], "to": "RUB", "course": "0.0105"}
+        ]})
+
+
+class FakeYooMoney(FakeServer):
+    def __init__(self, page_size: int = 100):
+        super().__init__()
+        self.page_size = page_size
+        self.operations: list[dict] = []
+        self.operation_ids = itertools.count(1)
+        self.app.router.add_post("/api/operation-history", self.history)
+
+    def pay(self, label: str, amount: float):
+        self.operations.append({
+            "operation_id": str(next(self.operation_ids)),
+            "status": "success",
+            "datetime": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "title": "Bench payment",
+            "direction": "in",
+            "amount": amount,
+            "label": label,
+            "type": "deposition"
+        })
+
+    async def history(self, request: web.Request) -> web.Response:
+        self.calls["operation-history"] += 1
+        data = await request.post()
+        operations = self.operations
+        if "from" in data:
+            since = datetime.fromisoformat(data["from"])
+            operations = [operation for operation in operations if datetime.fromisoformat(operation["datetime"]) >= since]
+        start = int(data.get("start_record", 0))
+        page = operations[start:start + self.page_size]
+        response = {"operations": page}
+        if start + self.page_size < len(operations):
+            response["next_record"] = str(start + self.page_size)
+        return web.json_response(response)
@@ -0,0 +1,223 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update, Message, CallbackQuery, Chat, User, Document
+from sqlalchemy import event
+import asyncio
+import itertools
+import re
+import statistics
+import time
+
+from bench.fakes import FakeServer, FakeTelegram, FakeHeleket, FakeYooMoney
+from handlers.client import client_router
+from handlers.admin import admin_router
+from database.models import engine, async_main
+from payment.registry import registry
+from payment.invoices import invoices
+from payment.webhook import setup_heleket_webhook
+from catalog import catalog
+from search import search
+from http_client import http
+from rates import rate_cache
+from app_config import CONFIG
+
+
+PAY_CODES = {"test": ["t"], "yoomoney": ["ym"], "heleket": ["hk", "hk.tron", "usdt.tron"]}
+
+
+class Benchmark:
+    def __init__(self, users: int, concurrency: int, products: int, provider: str, pay_delay: float, poll_delay: float, timeout: float):
+        self.users = users
+        self.concurrency = concurrency
+        self.products = products
+        self.provider = provider
+        self.poll_delay = poll_delay
+        self.timeout = timeout
+        self.telegram = FakeTelegram()
+        self.heleket = FakeHeleket(pay_delay=pay_delay)
+        self.yoomoney = FakeYooMoney()
+        self.webhook = FakeServer()
+        self.update_ids = itertools.count(1)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.queries = 0
+        self.purchases = 0
+        self.failures: Counter = Counter()
+        self.bot: Bot | None = None
+        self.dp: Dispatcher | None = None
+
+    async def setup(self):
+        use_webhook = CONFIG.get("USE_HELEKET_WEBHOOK")
+        if use_webhook:
+            setup_heleket_webhook(self.webhook.app)
+        for server in (self.telegram, self.heleket, self.yoomoney, self.webhook):
+            await server.start()
+        CONFIG["HELEKET_API_URL"] = self.heleket.url
+        CONFIG["HELEKET_WEBHOOK_URL"] = f"{self.webhook.url}{CONFIG.get('HELEKET_WEBHOOK_PATH', '/heleket/webhook')}"
+        for payment_method in registry.methods.values():
+            if use_webhook and payment_method.provider == "heleket":
+                continue
+            payment_method.PAYMENT_ATTMEP_DELAY = self.poll_delay
+            payment_method.PAYMENT_ATTEMPS = int(self.timeout / self.poll_delay)
+            if payment_method.provider == "yoomoney":
+                payment_method.reconciler.api_url = f"{self.yoomoney.url}/api/"
+
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count_query)
+        await async_main()
+        await search.sync()
+        await catalog.load()
+        await http.start()
+        if self.provider == "heleket":
+            rate_cache.start()
+
+        self.bot = Bot(
+            token="42:bench",
+            session=AiohttpSession(api=TelegramAPIServer.from_base(self.telegram.url))
+        )
+        self.dp = Dispatcher()
+        self.dp.include_router(client_router)
+        self.dp.include_router(admin_router)
+        await invoices.start(self.bot)
+
+    async def teardown(self):
+        await invoices.stop()
+        await rate_cache.stop()
+        await http.close()
+        await self.bot.session.close()
+        for server in (self.telegram, self.heleket, self.yoomoney, self.webhook):
+            await server.stop()
+
+    async def feed(self, step: str, update: Update):
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies[step].append(time.perf_counter() - started)
+
+    async def seed(self):
+        admin_id = CONFIG["ADMIN_ID"]
+        await self.feed("admin", self.message(admin_id, "/admin"))
+        for i in range(self.products):
+            await self.feed("admin", self.callback(admin_id, "add_product"))
+            await self.feed("admin", self.message(admin_id, f"Товар {i}"))
+            await self.feed("admin", self.message(admin_id, str(100 + i)))
+            await self.feed("admin", self.message(admin_id, f"Описание товара {i} для нагрузочного теста"))
+            await self.feed("admin", self.message(admin_id, document=Document(file_id=f"seed{i}", file_unique_id=f"seed{i}")))
+
+    async def customer(self, user_id: int, product_id: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            await self.feed("start", self.message(user_id, "/start"))
+            await self.feed("display_products", self.callback(user_id, "display_products"))
+            await self.feed("product_info", self.callback(user_id, f"product_info:{product_id}"))
+            await self.feed("buy_product", self.callback(user_id, f"buy_product:{product_id}"))
+
+            invoice = self.telegram.wait_for(user_id, "💵")
+            outcome = self.telegram.wait_for(user_id, "✅", "⚠️")
+            for code in PAY_CODES[self.provider]:
+                await self.feed("pay", self.callback(user_id, f"pay:{code}:{product_id}"))
+            try:
+                self.pay(await asyncio.wait_for(invoice, self.timeout))
+                result = await asyncio.wait_for(outcome, self.timeout)
+            except asyncio.TimeoutError:
+                self.failures["timeout"] += 1
+                return
+            if not result.startswith("✅"):
+                self.failures["not paid"] += 1
+                return
+
+            self.purchases += 1
+            await self.feed("download", self.callback(user_id, f"download:{product_id}"))
+            await self.feed("display_purchases", self.callback(user_id, "display_purchases"))
+
+    def pay(self, text: str):
+        url = re.search(r"https?://\S+", text).group(0)
+        if url.startswith(self.heleket.url):
+            self.heleket.pay(url.rsplit("/", 1)[1])
+        elif "yoomoney" in url:
+            query = parse_qs(urlparse(url).query)
+            self.yoomoney.pay(query["label"][0], float(query["sum"][0]))
+
+    async def run(self) -> dict:
+        await self.setup()
+        try:
+            await self.seed()
+            product_ids = [product.id for product in catalog.all()]
+            seed_calls = self.calls()
+            self.queries = 0
+            self.latencies.pop("admin", None)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                self.customer(1_000_000 + i, product_ids[i % len(product_ids)], semaphore)
+                for i in range(self.users)
+            ))
+            elapsed = time.perf_counter() - started
+            calls = self.calls() - seed_calls
+        finally:
+            await self.teardown()
+        return self.report(elapsed, calls)
+
+    def calls(self) -> Counter:
+        calls = Counter()
+        for name, server in (("telegram", self.telegram), ("heleket", self.heleket), ("yoomoney", self.yoomoney)):
+            for method, count in server.calls.items():
+                calls[f"{name}.{method}"] += count
+        return calls
+
+    def report(self, elapsed: float, calls: Counter) -> dict:
+        updates = sum(len(latencies) for latencies in self.latencies.values())
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            "users": self.users,
+            "purchases": self.purchases,
+            "failures": dict(self.failures),
+            "elapsed": elapsed,
+            "updates": updates,
+            "updates_per_second": updates / elapsed if elapsed else 0,
+            "latency": {"all": percentiles(all_latencies)} | {
+                step: percentiles(latencies) for step, latencies in self.latencies.items()
+            },
+            "calls": dict(calls),
+            "calls_per_purchase": sum(calls.values()) / self.purchases if self.purchases else None,
+            "queries": self.queries,
+            "queries_per_update": self.queries / updates if updates else 0
+        }
+
+    def _count_query(self, *args):
+        self.queries += 1
+
+    def message(self, user_id: int, text: str | None = None, document: Document | None = None) -> Update:
+        update_id = next(self.update_ids)
+        return Update(update_id=update_id, message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=user_id, is_bot=False, first_name="User"),
+            text=text,
+            document=document
+        ))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        update_id = next(self.update_ids)
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id),
+            from_user=User(id=user_id, is_bot=False, first_name="User"),
+            chat_instance=str(user_id),
+            data=data,
+            message=Message(
+                message_id=update_id,
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=User(id=1, is_bot=True, first_name="Bench"),
+                text="bench"
+            )
+        ))
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    if len(latencies) < 2:
+        return {"p50": latencies[0] * 1000 if latencies else 0, "p99": latencies[0] * 1000 if latencies else 0}
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": quantiles[49] * 1000, "p99": quantiles[98] * 1000}
@@ -0,0 +1,172 @@
+from collections import Counter
+from datetime import datetime
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+import asyncio
+import time
+
+import keyboards.admin as kb
+from database.models import Broadcast
+from database.requests import count_users, iter_user_ids, create_broadcast, get_running_broadcasts, update_broadcast
+from cluster import shard_of
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.resume_at
+
+
+def progress_text(broadcast: Broadcast, progress: Counter, status: str) -> str:
+    done = progress["sent"] + progress["blocked"] + progress["failed"]
+    return (
+        f"📣 Рассылка #{broadcast.id} {status}\n"
+        f"Обработано: {done} из {broadcast.total}\n"
+        f"Доставлено: {progress['sent']}\n"
+        f"Заблокировали бота: {progress['blocked']}\n"
+        f"Ошибки: {progress['failed']}"
+    )
+
+
+class Broadcaster:
+    def __init__(self, rate: float, concurrency: int, chunk_size: int, progress_interval: float, attempts: int = 5):
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.attempts = attempts
+        self.tasks: dict[int, asyncio.Task] = {}
+        self.cancelling: set[int] = set()
+        self.bot: Bot | None = None
+
+    async def start(self, bot: Bot, shard: int = 0, shards: int = 1):
+        self.bot = bot
+        for broadcast in await get_running_broadcasts():
+            if shard_of(broadcast.chat_id, shards) == shard:
+                logger.info(f"Resuming broadcast {broadcast.id} after user {broadcast.last_user_id}")
+                self._run(broadcast)
+
+    async def stop(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def begin(self, chat_id: int, message_id: int, progress_message_id: int) -> Broadcast:
+        broadcast = await create_broadcast(
+            chat_id=chat_id,
+            message_id=message_id,
+            progress_message_id=progress_message_id,
+            total=await count_users(),
+            created_at=datetime.now(),
+            status="running"
+        )
+        self._run(broadcast)
+        return broadcast
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        task = self.tasks.get(broadcast_id)
+        if task is None:
+            return False
+        self.cancelling.add(broadcast_id)
+        await update_broadcast(broadcast_id, status="cancelled")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.cancelling.discard(broadcast_id)
+        return True
+
+    def _run(self, broadcast: Broadcast):
+        task = asyncio.create_task(self._deliver(broadcast))
+        self.tasks[broadcast.id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(broadcast.id, None))
+
+    async def _deliver(self, broadcast: Broadcast):
+        progress = Counter(sent=broadcast.sent, blocked=broadcast.blocked, failed=broadcast.failed)
+        cursor = broadcast.last_user_id
+        reported = time.monotonic()
+        await self._report(broadcast, progress, "идет")
+        try:
+            async for user_ids in iter_user_ids(cursor, self.chunk_size):
+                for i in range(0, len(user_ids), self.concurrency):
+                    batch = user_ids[i:i + self.concurrency]
+                    for outcome in await asyncio.gather(*(self._send(broadcast, user_id) for user_id in batch)):
+                        progress[outcome] += 1
+                    cursor = batch[-1]
+                    if time.monotonic() - reported >= self.progress_interval:
+                        reported = time.monotonic()
+                        await update_broadcast(broadcast.id, last_user_id=cursor, **progress)
+                        await self._report(broadcast, progress, "идет")
+        except asyncio.CancelledError:
+            await update_broadcast(broadcast.id, last_user_id=cursor, **progress)
+            if broadcast.id in self.cancelling:
+                logger.info(f"Broadcast {broadcast.id} has been cancelled after {progress['sent']} messages")
+                await self._report(broadcast, progress, "отменена", final=True)
+            raise
+        except Exception:
+            await update_broadcast(broadcast.id, last_user_id=cursor, **progress)
+            logger.exception(f"Broadcast {broadcast.id} stopped after user {cursor}")
+            await self._report(broadcast, progress, "прервана, продолжится после перезапуска бота", final=True)
+            return
+
+        await update_broadcast(broadcast.id, last_user_id=cursor, status="done", **progress)
+        logger.info(f"Broadcast {broadcast.id} has finished: {dict(progress)}")
+        await self._report(broadcast, progress, "завершена", final=True)
+
+    async def _send(self, broadcast: Broadcast, user_id: int) -> str:
+        for _ in range(self.attempts):
+            await self.bucket.acquire()
+            try:
+                await self.bot.copy_message(chat_id=user_id, from_chat_id=broadcast.chat_id, message_id=broadcast.message_id)
+                return "sent"
+            except TelegramRetryAfter as e:
+                logger.warning(f"Broadcast {broadcast.id} is throttled for {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"
+            except TelegramAPIError:
+                return "failed"
+        return "failed"
+
+    async def _report(self, broadcast: Broadcast, progress: Counter, status: str, final: bool = False):
+        try:
+            await self.bot.edit_message_text(
+                text=progress_text(broadcast, progress, status),
+                chat_id=broadcast.chat_id,
+                message_id=broadcast.progress_message_id,
+                reply_markup=None if final else kb.cancel_broadcast(broadcast.id)
+            )
+        except TelegramAPIError:
+            pass
+
+
+broadcaster = Broadcaster(
+    rate=CONFIG.get("BROADCAST_RATE", 25),
+    concurrency=CONFIG.get("BROADCAST_CONCURRENCY", 10),
+    chunk_size=CONFIG.get("BROADCAST_CHUNK_SIZE", 1000),
+    progress_interval=CONFIG.get("BROADCAST_PROGRESS_INTERVAL", 5)
+)
@@ -0,0 +1,74 @@
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select
+import aiofiles
+import bisect
+
+import keyboards.client as kb
+from database.models import async_session, Product
+from database.requests import Page
+from app_config import CONFIG
+
+
+class Catalog:
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.products: dict[int, Product] = {}
+        self.ids: list[int] = []
+        self.keyboard: InlineKeyboardMarkup = kb.buy_products(Page([], has_prev=False, has_next=False))
+        self.descriptions: dict[int, str] = {}
+
+    async def load(self):
+        async with async_session() as session:
+            products = (await session.scalars(select(Product))).all()
+        self._publish({product.id: product for product in products})
+        self.descriptions = {}
+
+    def get(self, product_id: int | str) -> Product | None:
+        return self.products.get(int(product_id))
+
+    def all(self) -> list[Product]:
+        return list(self.products.values())
+
+    def page(self, after: int | None = None, before: int | None = None) -> Page:
+        products, ids = self.products, self.ids
+        if before is not None:
+            end = bisect.bisect_left(ids, before)
+            start = max(end - self.page_size, 0)
+        else:
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+            end = start + self.page_size
+        return Page([products[product_id] for product_id in ids[start:end]], has_prev=start > 0, has_next=end < len(ids))
+
+    async def description(self, product: Product) -> str:
+        description = self.descriptions.get(product.id)
+        if description is None:
+            async with aiofiles.open(product.description_path, 'r', encoding='utf-8') as description_file:
+                description = await description_file.read()
+            self.descriptions[product.id] = description
+        return description
+
+    def put(self, product: Product, description: str | None = None):
+        products = dict(self.products)
+        products[product.id] = product
+        self._publish(products)
+        for other in products.values():
+            if other.description_path == product.description_path:
+                self.descriptions.pop(other.id, None)
+        if description is None:
+            self.descriptions.pop(product.id, None)
+        else:
+            self.descriptions[product.id] = description
+
+    def remove(self, product_id: int | str):
+        products = dict(self.products)
+        products.pop(int(product_id), None)
+        self._publish(products)
+        self.descriptions.pop(int(product_id), None)
+
+    def _publish(self, products: dict[int, Product]):
+        ids = sorted(products)
+        first_page = Page([products[product_id] for product_id in ids[:self.page_size]], has_prev=False, has_next=len(ids) > self.page_size)
+        self.products, self.ids, self.keyboard = products, ids, kb.buy_products(first_page)
+
+
+catalog = Catalog(page_size=CONFIG.get("CATALOG_PAGE_SIZE", 10))
@@ -0,0 +1,56 @@
+from typing import Any, Awaitable, Callable
+import asyncio
+import json
+
+from app_config.logger_config import logger
+
+
+STREAM_LIMIT = 2 ** 24
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    return user_id % shards
+
+
+async def send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+    await writer.drain()
+
+
+async def receive(reader: asyncio.StreamReader) -> dict | None:
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class Cluster:
+    def __init__(self):
+        self.writer: asyncio.StreamWriter | None = None
+        self.handlers: dict[str, Callable[..., Awaitable[Any]]] = {}
+
+    def on(self, event: str, handler: Callable[..., Awaitable[Any]]):
+        self.handlers[event] = handler
+
+    async def publish(self, event: str, **payload):
+        if self.writer is None:
+            return
+        try:
+            await send(self.writer, {"type": "event", "event": event, **payload})
+        except ConnectionError:
+            logger.warning(f"Lost connection to the supervisor, {event} was not published")
+
+    async def reply(self, request_id: int, result: Any):
+        if self.writer is None:
+            return
+        try:
+            await send(self.writer, {"type": "reply", "request_id": request_id, "result": result})
+        except ConnectionError:
+            logger.warning(f"Lost connection to the supervisor, reply {request_id} was not sent")
+
+    async def dispatch(self, message: dict):
+        handler = self.handlers.get(message["event"])
+        if handler is not None:
+            payload = {key: value for key, value in message.items() if key not in ("type", "event")}
+            await handler(**payload)
+
+
+cluster = Cluster()
@@ -1,9 +1,46 @@
-from sqlalchemy import String, Integer, Table, ForeignKey, Column
+from sqlalchemy import String, Integer, BigInteger, DateTime, Table, ForeignKey, Column, inspect, text, event, make_url
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncEngine
 
+from datetime import datetime
 
-engine = create_async_engine(url = 'sqlite+aiosqlite:///db.sqlite3')
+from app_config import CONFIG
+
+
+def create_engine() -> AsyncEngine:
+    url = make_url(CONFIG.get("DATABASE_URL") or 'sqlite+aiosqlite:///db.sqlite3')
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(
+            url,
+            pool_size=CONFIG.get("DB_POOL_SIZE", 5),
+            max_overflow=CONFIG.get("DB_MAX_OVERFLOW", 10),
+            pool_pre_ping=True
+        )
+
+    busy_timeout = CONFIG.get("DB_BUSY_TIMEOUT", 5000)
+    if url.database in (None, "", ":memory:"):
+        sqlite_engine = create_async_engine(url)
+    else:
+        sqlite_engine = create_async_engine(
+            url,
+            pool_size=CONFIG.get("DB_POOL_SIZE", 5),
+            max_overflow=CONFIG.get("DB_MAX_OVERFLOW", 10),
+            connect_args={"timeout": busy_timeout / 1000}
+        )
+
+    @event.listens_for(sqlite_engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA mmap_size={int(CONFIG.get('DB_MMAP_SIZE', 268435456))}")
+        cursor.close()
+
+    return sqlite_engine
+
+
+engine = create_engine()
 
 async_session = async_sessionmaker(engine)
 
@@ -37,6 +74,8 @@ class Product(Base):
     price: Mapped[int] = mapped_column(Integer)
     description_path: Mapped[str] = mapped_column(String(255))
     file_path: Mapped[str] = mapped_column(String(255))
+    file_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    file_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
 
     users: Mapped[list["User"]] = relationship(
         "User",
@@ -45,6 +84,54 @@ class Product(Base):
     )
 
 
+class Invoice(Base):
+    __tablename__ = "invoices"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    order_id: Mapped[str] = mapped_column(String(255), index=True)
+    provider: Mapped[str] = mapped_column(String(32))
+    method: Mapped[str] = mapped_column(String(64))
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    product_id: Mapped[int] = mapped_column(Integer)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    payment_url: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+    status: Mapped[str] = mapped_column(String(16), default="pending", index=True)
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_id: Mapped[int] = mapped_column(Integer)
+    progress_message_id: Mapped[int] = mapped_column(Integer)
+    total: Mapped[int] = mapped_column(Integer)
+    last_user_id: Mapped[int] = mapped_column(BigInteger, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    status: Mapped[str] = mapped_column(String(16), default="running", index=True)
+
+
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
 async def async_main():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        if conn.dialect.name == "sqlite":
+            await conn.execute(text(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, description, tokenize="unicode61 remove_diacritics 2")'
+            ))
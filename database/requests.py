@@ -0,0 +1,149 @@
+from typing import Any, AsyncIterator, NamedTuple
+from sqlalchemy import select, exists, update, insert, func, Table, Select
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.sql.dml import Insert
+
+from database.models import engine, async_session, User, Product, Invoice, Broadcast, user_products
+
+
+class Page(NamedTuple):
+    items: list[Any]
+    has_prev: bool
+    has_next: bool
+
+
+def insert_or_ignore(table: Table) -> Insert:
+    if engine.dialect.name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table).prefix_with("IGNORE")
+
+
+async def register_user(user_id: int):
+    async with async_session() as session:
+        await session.execute(insert_or_ignore(User.__table__).values(id=user_id))
+        await session.commit()
+
+
+async def owns_product(user_id: int, product_id: int) -> bool:
+    async with async_session() as session:
+        return await session.scalar(select(exists().where(
+            user_products.c.user_id == user_id,
+            user_products.c.product_id == product_id
+        )))
+
+
+async def keyset_page(query: Select, key, limit: int, after: int | None = None, before: int | None = None) -> Page:
+    async with async_session() as session:
+        if before is not None:
+            rows = list((await session.execute(query.where(key < before).order_by(key.desc()).limit(limit + 1))).all())
+            return Page(rows[:limit][::-1], has_prev=len(rows) > limit, has_next=True)
+        if after is not None:
+            query = query.where(key > after)
+        rows = list((await session.execute(query.order_by(key).limit(limit + 1))).all())
+        return Page(rows[:limit], has_prev=after is not None, has_next=len(rows) > limit)
+
+
+async def get_purchases(user_id: int, limit: int, after: int | None = None, before: int | None = None) -> Page:
+    return await keyset_page(
+        select(Product.id, Product.name, Product.price)
+        .join(user_products, user_products.c.product_id == Product.id)
+        .where(user_products.c.user_id == user_id),
+        key=Product.id,
+        limit=limit,
+        after=after,
+        before=before
+    )
+
+
+async def set_product_file_id(product_id: int, file_id: str):
+    async with async_session() as session:
+        await session.execute(update(Product).where(Product.id == product_id).values(file_id=file_id))
+        await session.commit()
+
+
+async def create_invoice(**values) -> Invoice:
+    async with async_session() as session:
+        invoice = Invoice(**values)
+        session.add(invoice)
+        await session.commit()
+        await session.refresh(invoice)
+        return invoice
+
+
+async def get_pending_invoices() -> list[Invoice]:
+    async with async_session() as session:
+        return list(await session.scalars(
+            select(Invoice).where(Invoice.status == "pending").order_by(Invoice.expires_at)
+        ))
+
+
+async def set_invoice_status(invoice_id: int, status: str):
+    async with async_session() as session:
+        await session.execute(
+            update(Invoice).where(Invoice.id == invoice_id, Invoice.status == "pending").values(status=status)
+        )
+        await session.commit()
+
+
+async def complete_invoice(invoice: Invoice) -> bool:
+    async with async_session() as session:
+        status = await session.scalar(select(Invoice.status).where(Invoice.id == invoice.id))
+        granted = status == "pending" and await session.get(Product, invoice.product_id) is not None
+        if granted:
+            await session.execute(insert_or_ignore(user_products).values(user_id=invoice.user_id, product_id=invoice.product_id))
+        await session.execute(update(Invoice).where(Invoice.id == invoice.id).values(status="paid"))
+        await session.commit()
+        return granted
+
+
+async def set_invoice_message(invoice_id: int, chat_id: int, message_id: int):
+    async with async_session() as session:
+        await session.execute(update(Invoice).where(Invoice.id == invoice_id).values(chat_id=chat_id, message_id=message_id))
+        await session.commit()
+
+
+async def detach_user_invoices(user_id: int):
+    async with async_session() as session:
+        await session.execute(
+            update(Invoice).where(Invoice.user_id == user_id, Invoice.status == "pending").values(message_id=None)
+        )
+        await session.commit()
+
+
+async def count_users() -> int:
+    async with async_session() as session:
+        return await session.scalar(select(func.count()).select_from(User))
+
+
+async def iter_user_ids(after: int, chunk_size: int) -> AsyncIterator[list[int]]:
+    while True:
+        async with async_session() as session:
+            user_ids = list(await session.scalars(
+                select(User.id).where(User.id > after).order_by(User.id).limit(chunk_size)
+            ))
+        if not user_ids:
+            return
+        yield user_ids
+        after = user_ids[-1]
+
+
+async def create_broadcast(**values) -> Broadcast:
+    async with async_session() as session:
+        broadcast = Broadcast(**values)
+        session.add(broadcast)
+        await session.commit()
+        await session.refresh(broadcast)
+        return broadcast
+
+
+async def get_running_broadcasts() -> list[Broadcast]:
+    async with async_session() as session:
+        return list(await session.scalars(select(Broadcast).where(Broadcast.status == "running")))
+
+
+async def update_broadcast(broadcast_id: int, **values):
+    async with async_session() as session:
+        await session.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(**values))
+        await session.commit()
@@ -3,14 +3,20 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
+from sqlalchemy import update
 import os
-import shutil
 
 import keyboards.admin as kb
-from database.models import async_session, Product
+from database.models import async_session, Product, Invoice
+from catalog import catalog
+from cluster import cluster
+from storage import storage
+from search import search
+from broadcast import broadcaster
+from payment.invoices import invoices
 from app_config.logger_config import logger
 from app_config import CONFIG
+from utils import parse_cursor
 
 admin_router = Router()
 
@@ -21,6 +27,10 @@ class CreateProduct(StatesGroup):
     waiting_for_product_file = State()
 
 
+class CreateBroadcast(StatesGroup):
+    waiting_for_broadcast_message = State()
+
+
 @admin_router.message(Command('admin'))
 async def admin_panel(message: Message):
     if message.from_user.id == CONFIG['ADMIN_ID']:
@@ -69,27 +79,26 @@ async def process_product_file(message: Message, state: FSMContext):
         product_description = data["product_description"]
         product_file = data["product_file"]
 
-        if not os.path.exists(f'products/{product_name}'):
-            os.makedirs(f'products/{product_name}')
-
-        with open(f'products/{product_name}/description.txt', 'w+', encoding='utf-8') as description_file:
-            description_file.write(product_description)
-
-        bot = message.bot
-
-        file = await bot.get_file(product_file.file_id)
-        await bot.download_file(file.file_path, destination=f"products/{product_name}/prog.zip")
+        description_path = await storage.save_text(product_description)
+        file_path = await storage.save_upload(message.bot, product_file.file_id, suffix=os.path.splitext(product_file.file_name)[1] if product_file.file_name else None)
 
         async with async_session() as session:
-            session.add(Product(
+            product = Product(
                 name=product_name,
                 price=product_price,
-                description_path=f'products/{product_name}/description.txt',
-                file_path=f"products/{product_name}/prog.zip"
-                ))
+                description_path=description_path,
+                file_path=file_path,
+                file_name=product_file.file_name,
+                file_id=product_file.file_id
+                )
+            session.add(product)
             await session.commit()
+            await session.refresh(product)
+        catalog.put(product, description=product_description)
+        await search.index(product, product_description)
+        await cluster.publish("catalog")
 
-        logger.info(f"Product {product_name} has been added.")
+        logger.info(f"Product {product_name} has been added.", extra={"product_id": product.id})
         await message.answer(f"Товар добавлен: {product_name} за {product_price} рублей")
 
         await state.clear()
@@ -99,12 +108,18 @@ async def process_product_file(message: Message, state: FSMContext):
 async def choose_product_to_delete(callback: CallbackQuery):
     await callback.answer()
     if callback.from_user.id == CONFIG['ADMIN_ID']:
-        async with async_session() as session:
-            products = (await session.scalars(select(Product))).all()
-            if products:
-                await callback.message.answer(f"Выбери товар, который необходимо удалить:", reply_markup=kb.products_to_delete(products))
-            else:
-                await callback.message.answer(f"У тебя нет никаких товаров!")
+        page = catalog.page()
+        if page.items:
+            await callback.message.answer(f"Выбери товар, который необходимо удалить:", reply_markup=kb.products_to_delete(page))
+        else:
+            await callback.message.answer(f"У тебя нет никаких товаров!")
+
+
+@admin_router.callback_query(F.data.startswith('admin_products:'))
+async def products_to_delete_page(callback: CallbackQuery):
+    await callback.answer()
+    if callback.from_user.id == CONFIG['ADMIN_ID']:
+        await callback.message.edit_reply_markup(reply_markup=kb.products_to_delete(catalog.page(**parse_cursor(callback.data))))
 
 
 @admin_router.callback_query(F.data.startswith('delete_product'))
@@ -113,16 +128,66 @@ async def delete_product(callback: CallbackQuery):
     product_id = callback.data.split(':')[1]
 
     async with async_session() as session:
-        product = await session.scalar(select(Product).where(Product.id == product_id))
-
-        if os.path.exists(f"products/{product.name}"):
-            shutil.rmtree(f"products/{product.name}")
-
+        product = await session.get(Product, int(product_id))
+        if product is None:
+            return
+        product_name = product.name
+        paths = {product.description_path, product.file_path}
+
+        await session.execute(
+            update(Invoice).where(Invoice.product_id == product.id, Invoice.status == "pending").values(status="expired")
+        )
         await session.delete(product)
         await session.commit()
+    catalog.remove(product_id)
+    await invoices.expire_product(int(product_id))
+    await search.remove(product_id)
+    await cluster.publish("catalog")
+
+    in_use = {path for other in catalog.all() for path in (other.description_path, other.file_path)}
+    for path in paths - in_use:
+        await storage.remove(path)
+    legacy_dir = os.path.join(storage.root, product_name)
+    if legacy_dir not in (storage.blobs, storage.tmp) and all(os.path.dirname(path) == legacy_dir for path in paths):
+        await storage.remove_tree(legacy_dir)
+
+    logger.info(f"Product {product_name} has been deleted.", extra={"product_id": int(product_id)})
+    await callback.message.answer(f"Товар {product_name} удален!")
 
-    logger.info(f"Product {product.name} has been deleted.")
-    await callback.message.answer(f"Товар {product.name} удален!")
 
+async def ask_broadcast_message(message: Message, state: FSMContext):
+    if broadcaster.tasks:
+        await message.answer("Рассылка уже идет, дождись ее окончания или отмени ее.")
+        return
+    await message.answer("Пришли сообщение для рассылки, его получат все пользователи бота:")
+    await state.set_state(CreateBroadcast.waiting_for_broadcast_message)
 
 
+@admin_router.message(Command('broadcast'))
+async def broadcast_command(message: Message, state: FSMContext):
+    if message.from_user.id == CONFIG['ADMIN_ID']:
+        await ask_broadcast_message(message, state)
+
+
+@admin_router.callback_query(F.data == ('broadcast'))
+async def broadcast_button(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    if callback.from_user.id == CONFIG['ADMIN_ID']:
+        await ask_broadcast_message(callback.message, state)
+
+
+@admin_router.message(CreateBroadcast.waiting_for_broadcast_message)
+async def process_broadcast_message(message: Message, state: FSMContext):
+    if message.from_user.id == CONFIG['ADMIN_ID']:
+        await state.clear()
+        progress_message = await message.answer("📣 Рассылка запускается...")
+        broadcast = await broadcaster.begin(message.chat.id, message.message_id, progress_message.message_id)
+        logger.info(f"Broadcast {broadcast.id} has been started for {broadcast.total} users.")
+
+
+@admin_router.callback_query(F.data.startswith('cancel_broadcast:'))
+async def cancel_broadcast(callback: CallbackQuery):
+    await callback.answer()
+    if callback.from_user.id == CONFIG['ADMIN_ID']:
+        if not await broadcaster.cancel(int(callback.data.split(':')[1])):
+            await callback.message.answer("Эта рассылка уже не идет.")
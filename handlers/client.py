@@ -1,208 +1,255 @@
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
-from aiogram.filters import CommandStart
-from aiogram.enums import ChatMemberStatus
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-import asyncio
+from aiogram import Bot, Router, F
+from aiogram.types import Message, CallbackQuery, FSInputFile, ChatMemberUpdated, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.filters import CommandStart, CommandObject
+from aiogram.exceptions import TelegramBadRequest
 
 import keyboards.client as kb
-from payment import PaymentMethod
-from database.models import async_session, User, Product
+from payment.registry import registry
+from payment.invoices import invoices
+from health import ProviderError, ProviderUnavailable
+from middlewares import SubscriptionMiddleware, SUBSCRIBED_STATUSES, membership, subscribe_text
+from database.models import User, Product
+from database.requests import register_user, owns_product, get_purchases, set_product_file_id
+from catalog import catalog
+from search import search
+from cluster import cluster
 from app_config.logger_config import logger
 from app_config import CONFIG
-from utils import get_all_subclasses
+from utils import parse_cursor
 
 
 client_router = Router()
+client_router.message.middleware(SubscriptionMiddleware(membership))
+client_router.callback_query.middleware(SubscriptionMiddleware(membership))
 
-tasks = {}
 
-@client_router.callback_query(F.data == "None")
+@client_router.callback_query(F.data == "None", flags={"subscription": "skip"})
 async def none_callback(callback: CallbackQuery):
     await callback.answer()
     
 
-@client_router.message(CommandStart())
-async def start_message(message: Message):
+@client_router.chat_member(F.chat.id == CONFIG["CHANNEL_ID"])
+async def channel_member_updated(update: ChatMemberUpdated):
+    membership.set(update.new_chat_member.user.id, update.new_chat_member.status in SUBSCRIBED_STATUSES)
+    await cluster.publish("membership", user_id=update.new_chat_member.user.id)
+
+
+@client_router.message(CommandStart(deep_link=True, magic=F.args.regexp(r"^product_\d+$")), flags={"subscription": "optional"})
+async def start_product(message: Message, command: CommandObject, subscribed: bool):
+    await register_user(message.from_user.id)
+    if not subscribed:
+        await message.answer(subscribe_text(message.from_user.first_name))
+        return
+
+    product = catalog.get(command.args.split('_')[1])
+    if product is None:
+        await message.answer("Товар не найден!", reply_markup=kb.return_to_main_menu)
+        return
+    await send_product_info(message, message.from_user.id, product)
+
+
+@client_router.message(CommandStart(), flags={"subscription": "optional"})
+async def start_message(message: Message, subscribed: bool):
     id = message.from_user.id
-    if id in tasks.keys():
-        tasks[id].cancel()
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.id == id))
-        if not user:
-            session.add(User(id=id))
-            await session.commit()
+    await invoices.detach_user(id)
+    await register_user(id)
     
-    member = await message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
+    if subscribed:
         await message.answer(f"Добро пожаловать, {message.from_user.first_name}!", reply_markup=kb.main)
     else:
-        await message.answer(f"Добро пожаловать, {message.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+        await message.answer(subscribe_text(message.from_user.first_name))
 
 
-@client_router.callback_query(F.data == "main_menu")
-async def start_callback(callback: CallbackQuery):
+@client_router.callback_query(F.data == "main_menu", flags={"subscription": "optional"})
+async def start_callback(callback: CallbackQuery, subscribed: bool):
     await callback.message.delete()
     id = callback.from_user.id
-    if id in tasks.keys():
-        tasks[id].cancel()
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        async with async_session() as session:
-            user = await session.scalar(select(User).where(User.id == id))
-            if not user:
-                session.add(User(id=id))
-                await session.commit()
+    await invoices.detach_user(id)
+    if subscribed:
+        await register_user(id)
         await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}!", reply_markup=kb.main)
         await callback.answer()
     else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+        await callback.message.answer(subscribe_text(callback.from_user.first_name))
     
 
+@client_router.callback_query(F.data == "cancel_payment", flags={"subscription": "optional"})
+async def cancel_payment(callback: CallbackQuery, subscribed: bool):
+    await invoices.cancel_message(callback.from_user.id, callback.message.message_id)
+    await start_callback(callback, subscribed)
+
+
 @client_router.callback_query(F.data == ('display_products'))
 async def display_products(callback: CallbackQuery):
     await callback.message.delete()
-    id = callback.from_user.id
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        async with async_session() as session:
-            products = (await session.scalars(select(Product))).all()
-        await callback.message.answer("💰 Наши товары:", reply_markup=kb.buy_products(products))
-        await callback.answer()
-    else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+    await callback.message.answer("💰 Наши товары:", reply_markup=catalog.keyboard)
+    await callback.answer()
+
+
+@client_router.callback_query(F.data.startswith('products:'))
+async def products_page(callback: CallbackQuery):
+    await callback.message.edit_reply_markup(reply_markup=kb.buy_products(catalog.page(**parse_cursor(callback.data))))
+    await callback.answer()
 
 
 @client_router.callback_query(F.data == ('display_purchases'))
 async def display_purchases(callback: CallbackQuery):
     await callback.message.delete()
-    id = callback.from_user.id
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        async with async_session() as session:
-            user = await session.scalar(
-                select(User).options(selectinload(User.products)).where(User.id == callback.from_user.id)
-            )
-            if user.products:
-                await callback.message.answer("💵 Твои покупки:", reply_markup=kb.buy_products(user.products))
-            else:
-                await callback.message.answer("Ты пока что ничего не купил!", reply_markup=kb.return_to_main_menu)
-        await callback.answer()
+    purchases = await get_purchases(callback.from_user.id, limit=catalog.page_size)
+    if purchases.items:
+        await callback.message.answer("💵 Твои покупки:", reply_markup=kb.buy_products(purchases, prefix="purchases"))
     else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+        await callback.message.answer("Ты пока что ничего не купил!", reply_markup=kb.return_to_main_menu)
+    await callback.answer()
+
+
+@client_router.callback_query(F.data.startswith('purchases:'))
+async def purchases_page(callback: CallbackQuery):
+    purchases = await get_purchases(callback.from_user.id, limit=catalog.page_size, **parse_cursor(callback.data))
+    await callback.message.edit_reply_markup(reply_markup=kb.buy_products(purchases, prefix="purchases"))
+    await callback.answer()
 
 
 @client_router.callback_query(F.data.startswith('product_info'))
 async def product_info(callback: CallbackQuery):
     await callback.message.delete()
-    id = callback.from_user.id
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        product_id = callback.data.split(':')[1]
-
-        async with async_session() as session:
-            product = await session.scalar(select(Product).where(Product.id == product_id))
-            user = await session.scalar(
-                select(User).options(selectinload(User.products)).where(User.id == callback.from_user.id)
-            )
-        
-            with open(f"products/{product.name}/description.txt", 'r', encoding='utf-8') as description_file:
-                if product in user.products:
-                    await callback.message.answer(description_file.read(), reply_markup=kb.get_file(product))
-                else:
-                    await callback.message.answer(description_file.read(), reply_markup=kb.buy_product(product))
+    product = catalog.get(callback.data.split(':')[1])
+    if product is None:
+        await callback.message.answer("Товар не найден!", reply_markup=kb.return_to_main_menu)
         await callback.answer()
+        return
+
+    await send_product_info(callback.message, callback.from_user.id, product)
+    await callback.answer()
+
+
+async def send_product_info(message: Message, user_id: int, product: Product):
+    owned = await owns_product(user_id, product.id)
+
+    description = await catalog.description(product)
+    if owned:
+        await message.answer(description, reply_markup=kb.get_file(product))
     else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+        await message.answer(description, reply_markup=kb.buy_product(product))
+
+
+@client_router.inline_query()
+async def search_products(inline_query: InlineQuery, bot: Bot):
+    if inline_query.query.strip():
+        products = [product for product_id in await search.search(inline_query.query) if (product := catalog.get(product_id))]
+    else:
+        products = catalog.page().items
+
+    me = await bot.me()
+    await inline_query.answer(
+        [
+            InlineQueryResultArticle(
+                id=str(product.id),
+                title=product.name,
+                description=f"{product.price} рублей",
+                input_message_content=InputTextMessageContent(message_text=f"{product.name} - {product.price} рублей"),
+                reply_markup=kb.open_product(me.username, product)
+            )
+            for product in products
+        ],
+        cache_time=CONFIG.get("SEARCH_CACHE_TIME", 60)
+    )
 
 
 @client_router.callback_query(F.data.startswith("download"))
 async def download(callback: CallbackQuery):
-    id = callback.from_user.id
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        product_id = callback.data.split(':')[1]
-
-        async with async_session() as session:
-            product = await session.scalar(select(Product).where(Product.id == product_id))
-            user = await session.scalar(
-                select(User).options(selectinload(User.products)).where(User.id == callback.from_user.id)
+    product = catalog.get(callback.data.split(':')[1])
+
+    owned = product is not None and await owns_product(callback.from_user.id, product.id)
+
+    if owned:
+        await send_product_file(callback.message, product)
+    await callback.answer()
+
+
+async def send_product_file(message: Message, product: Product):
+    if product.file_id:
+        try:
+            await message.answer_document(product.file_id)
+            return
+        except TelegramBadRequest as e:
+            logger.warning(
+                f"Telegram rejected file_id of {product.name}, uploading it again: {e.message}",
+                extra={"product_id": product.id}
             )
-        
-            if product in user.products:
-                await callback.message.answer_document(FSInputFile(f'products/{product.name}/prog.zip'))
-        await callback.answer()
-    else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+
+    sent = await message.answer_document(FSInputFile(product.file_path, filename=product.file_name))
+    product.file_id = sent.document.file_id
+    await set_product_file_id(product.id, product.file_id)
 
 
 @client_router.callback_query(F.data.startswith('buy_product'))
 async def buy_product(callback: CallbackQuery):
     await callback.message.delete()
-    id = callback.from_user.id
-    member = await callback.message.bot.get_chat_member(CONFIG["CHANNEL_ID"], id)
-    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-        product_id = callback.data.split(':')[1]
-
-        async with async_session() as session:
-            product = await session.scalar(select(Product).where(Product.id == product_id))
-            user = await session.scalar(
-                select(User).options(selectinload(User.products)).where(User.id == callback.from_user.id)
-            )
-            if not product in user.products:
-                await callback.message.answer("💰 Выбери способ оплаты:", reply_markup=await kb.get_payment_methods(product=product, payment_methods=PaymentMethod.__subclasses__()))
-        await callback.answer()
+    product = catalog.get(callback.data.split(':')[1])
+
+    owned = product is None or await owns_product(callback.from_user.id, product.id)
+
+    if not owned:
+        await send_payment_methods(callback.message, product)
+    await callback.answer()
+
+
+async def send_payment_methods(message: Message, product: Product, text: str = "💰 Выбери способ оплаты:"):
+    payment_methods = registry.options()
+    if payment_methods:
+        await message.answer(text, reply_markup=await kb.get_payment_methods(product=product, payment_methods=payment_methods))
     else:
-        await callback.message.answer(f"Добро пожаловать, {callback.from_user.first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}")
+        await message.answer("⚠️ Оплата временно недоступна, попробуй позже!", reply_markup=kb.return_to_main_menu)
 
 
 @client_router.callback_query(F.data.startswith('pay'))
 async def pay(callback: CallbackQuery):
     await callback.message.delete()
-    payment_method_name = callback.data.split(':')[1]
-    product_id = callback.data.split(':')[2]
-    async with async_session() as session:
-        product = await session.scalar(select(Product).where(Product.id == product_id))
-    for payment_method in PaymentMethod.__subclasses__():
-        if payment_method.name == payment_method_name:
-            if payment_method.__subclasses__():
-                await callback.message.answer("💰 Выбери способ оплаты:", reply_markup=await kb.get_payment_methods(product=product, payment_methods=payment_method.__subclasses__()))
-                return
-    tasks[callback.from_user.id] = asyncio.create_task(process_payment(callback))
-    
+    code = callback.data.split(':')[1]
+    product = catalog.get(callback.data.split(':')[2])
+    if product is None:
+        await callback.answer()
+        return
+    if registry.is_group(code):
+        if registry.available(code):
+            await callback.message.answer("💰 Выбери способ оплаты:", reply_markup=await kb.get_payment_methods(product=product, payment_methods=registry.options(code)))
+        else:
+            await send_payment_methods(callback.message, product, "⚠️ Этот способ оплаты сейчас недоступен, выбери другой:")
+        await callback.answer()
+        return
+    await process_payment(callback)
 
 
 async def process_payment(callback: CallbackQuery):
     await callback.answer()
-    payment_method_name = callback.data.split(':')[1]
-    product_id = callback.data.split(':')[2]
+    payment_method = registry.get(callback.data.split(':')[1])
+    product = catalog.get(callback.data.split(':')[2])
     user_id = callback.from_user.id
-    async with async_session() as session:
-        product = await session.scalar(select(Product).where(Product.id == product_id))
-        user = await session.scalar(
-            select(User).options(selectinload(User.products)).where(User.id == user_id)
-        )
-        if not product in user.products:
-            for payment_method in get_all_subclasses(PaymentMethod):
-                if payment_method.name == payment_method_name:
-                    payment = payment_method(product=product, user=user)
-                    payment_message = await payment.get_payment_message()
-                    msg = await callback.message.answer(payment_message, reply_markup=kb.cancel_payment)
-                    for _ in range(payment.PAYMENT_ATTEMPS):
-                        paid = await payment.check_payment()
-                        if paid:
-                            await msg.delete()
-                            logger.info(f"User {callback.from_user.full_name} has bought {product.name}: {product.price}")
-                            await callback.message.answer("✅ Оплата прошла успешно! Скачать товар можно, по кнопке ⬇️ или во вкладке 🛒 Мои покупки!", reply_markup=kb.get_file(product))
-
-                            user.products.append(product)
-                            await session.commit()
-
-                            return True
-                        
-                        await asyncio.sleep(payment.PAYMENT_ATTMEP_DELAY)
-
-                    await msg.delete()
-                    await callback.message.answer("⚠️ Не смогли найти твою оплату!", reply_markup=kb.return_to_main_menu)
+    if payment_method is None or await owns_product(user_id, product.id):
+        return
+
+    async with invoices.lock(user_id, product.id, payment_method.name):
+        invoice = invoices.find_open(user_id, product.id, payment_method.name)
+        if invoice is not None:
+            payment = payment_method(
+                product=product,
+                user=User(id=user_id),
+                order_id=invoice.order_id,
+                created_at=invoice.created_at,
+                payment_url=invoice.payment_url
+            )
+            msg = await callback.message.answer(payment.payment_message(), reply_markup=kb.cancel_payment)
+            await invoices.attach(invoice, chat_id=msg.chat.id, message_id=msg.message_id)
+            return
+
+        payment = payment_method(product=product, user=User(id=user_id))
+        try:
+            payment_message = await payment.get_payment_message()
+        except (ProviderUnavailable, ProviderError) as e:
+            logger.warning(f"Could not create {payment_method.name} invoice: {e}", extra={"user_id": user_id, "product_id": product.id})
+            await send_payment_methods(callback.message, product, "⚠️ Этот способ оплаты сейчас недоступен, выбери другой:")
+            return
+        msg = await callback.message.answer(payment_message, reply_markup=kb.cancel_payment)
+        await invoices.open(payment, chat_id=msg.chat.id, message_id=msg.message_id)
     
\ No newline at end of file
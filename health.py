@@ -0,0 +1,107 @@
+from typing import Any, Awaitable, Callable
+from aiohttp import ClientError
+import asyncio
+import time
+
+from metrics import payment_provider_up
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+class ProviderError(Exception):
+    pass
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class ProviderHealth:
+    def __init__(self, name: str, timeout: float, concurrency: int, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def available(self) -> bool:
+        return self.retry_in() == 0
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    async def call(self, function: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        probe = self.opened_at is not None
+        if probe and (not self.available or self.probing):
+            raise ProviderUnavailable(f"{self.name} is unavailable for {self.retry_in():.0f}s")
+        self.probing = self.probing or probe
+        try:
+            async with self.semaphore:
+                if self.opened_at is not None and not probe:
+                    raise ProviderUnavailable(f"{self.name} is unavailable for {self.retry_in():.0f}s")
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        result = await function(*args, **kwargs)
+                except (TimeoutError, ClientError) as e:
+                    self._failure(probe)
+                    raise ProviderUnavailable(f"{self.name} request failed: {e!r}") from e
+        finally:
+            if probe:
+                self.probing = False
+        if self.opened_at is not None:
+            logger.info(f"{self.name} has recovered")
+        self.failures = 0
+        self.opened_at = None
+        return result
+
+    def _failure(self, probe: bool):
+        self.failures += 1
+        if probe or self.failures >= self.failure_threshold:
+            if not probe:
+                logger.warning(f"{self.name} failed {self.failures} times in a row, pausing it for {self.reset_timeout}s")
+            self.opened_at = time.monotonic()
+
+
+class ProviderMonitor:
+    def __init__(self, timeout: float, concurrency: int, failure_threshold: int, reset_timeout: float):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.providers: dict[str, ProviderHealth] = {}
+
+    def get(self, provider: str) -> ProviderHealth:
+        if provider not in self.providers:
+            self.providers[provider] = ProviderHealth(
+                provider,
+                timeout=self.timeout,
+                concurrency=self.concurrency,
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout
+            )
+        return self.providers[provider]
+
+    def available(self, provider: str) -> bool:
+        return provider not in self.providers or self.providers[provider].available
+
+    def retry_in(self, provider: str) -> float:
+        return self.providers[provider].retry_in() if provider in self.providers else 0
+
+    async def call(self, provider: str, function: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        return await self.get(provider).call(function, *args, **kwargs)
+
+
+health = ProviderMonitor(
+    timeout=CONFIG.get("PROVIDER_TIMEOUT", 20),
+    concurrency=CONFIG.get("PROVIDER_CONCURRENCY", 10),
+    failure_threshold=CONFIG.get("PROVIDER_FAILURE_THRESHOLD", 5),
+    reset_timeout=CONFIG.get("PROVIDER_RESET_TIMEOUT", 30)
+)
+
+payment_provider_up.set_function(lambda: {(name,): int(provider.available) for name, provider in health.providers.items()})
@@ -0,0 +1,74 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError, TraceConfig
+import asyncio
+import random
+
+from app_config import CONFIG
+
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpClient:
+    def __init__(self, limit: int, limit_per_host: int, timeout: float, connect_timeout: float, retries: int, backoff: float):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.trace_configs: list[TraceConfig] = []
+        self._session: ClientSession | None = None
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                ),
+                timeout=self.timeout,
+                trace_configs=self.trace_configs
+            )
+        return self._session
+
+    async def start(self):
+        self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request_json(self, method: str, url: str, idempotent: bool | None = None, **kwargs) -> dict:
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        retries = self.retries if idempotent else 0
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    if response.status < 500:
+                        return await response.json(content_type=None)
+                    if attempt == retries:
+                        response.raise_for_status()
+            except (ClientError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    async def get_json(self, url: str, **kwargs) -> dict:
+        return await self.request_json("GET", url, **kwargs)
+
+    async def post_json(self, url: str, **kwargs) -> dict:
+        return await self.request_json("POST", url, **kwargs)
+
+
+http = HttpClient(
+    limit=CONFIG.get("HTTP_POOL_SIZE", 100),
+    limit_per_host=CONFIG.get("HTTP_POOL_SIZE_PER_HOST", 20),
+    timeout=CONFIG.get("HTTP_TIMEOUT", 5),
+    connect_timeout=CONFIG.get("HTTP_CONNECT_TIMEOUT", 3),
+    retries=CONFIG.get("HTTP_RETRIES", 2),
+    backoff=CONFIG.get("HTTP_RETRY_BACKOFF", 0.5)
+)
@@ -1,15 +1,25 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from database.models import Product
+from database.requests import Page
+from keyboards.client import navigation
 
 
 main = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="ДОБАВИТЬ ТОВАР", callback_data="add_product")],
-    [InlineKeyboardButton(text="УДАЛИТЬ ТОВАР", callback_data="choose_product_to_delete")]
+    [InlineKeyboardButton(text="УДАЛИТЬ ТОВАР", callback_data="choose_product_to_delete")],
+    [InlineKeyboardButton(text="РАССЫЛКА", callback_data="broadcast")]
 ])
 
-def products_to_delete(products: list[Product]):
-    return InlineKeyboardMarkup(inline_keyboard=[
+def products_to_delete(page: Page):
+    keyboard = [
         [InlineKeyboardButton(text=f"УДАЛИТЬ '{product.name}'", callback_data=f"delete_product:{product.id}")]
-        for product in products
+        for product in page.items
+    ]
+    if row := navigation(page, "admin_products"):
+        keyboard.append(row)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def cancel_broadcast(broadcast_id: int):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="ОТМЕНИТЬ РАССЫЛКУ", callback_data=f"cancel_broadcast:{broadcast_id}")]
     ])
\ No newline at end of file
@@ -1,7 +1,7 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from payment import PaymentMethod
 from database.models import Product
+from database.requests import Page
 
 
 main = InlineKeyboardMarkup(inline_keyboard=[
@@ -14,7 +14,7 @@ return_to_main_menu = InlineKeyboardMarkup(inline_keyboard=[
 ])
 
 cancel_payment = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text="❌ Отменить оплату", callback_data=f"main_menu")]
+    [InlineKeyboardButton(text="❌ Отменить оплату", callback_data=f"cancel_payment")]
 ])
 
 def get_file(product: Product):
@@ -23,26 +23,32 @@ def get_file(product: Product):
         [InlineKeyboardButton(text="🏚 Главное меню", callback_data=f"main_menu")]
     ])
 
-async def get_payment_methods(product: Product, payment_methods: list[PaymentMethod]):
+async def get_payment_methods(product: Product, payment_methods: list[tuple[str, str]]):
     if len(payment_methods) <= 6:
         keyboard = [
-            [InlineKeyboardButton(text=method.name, callback_data=f"pay:{method.name}:{product.id}")] for method in payment_methods
+            [InlineKeyboardButton(text=name, callback_data=f"pay:{code}:{product.id}")] for code, name in payment_methods
         ]
     else:
         columns = 3
         keyboard = []
         i = 0
-        while i < len(payment_methods) - 1:
+        while i < len(payment_methods):
             keyboard.append([])
             for j in range(columns):
                 if i < len(payment_methods):
-                    keyboard[i // columns].append(InlineKeyboardButton(text=payment_methods[i].name, callback_data=f"pay:{payment_methods[i].name}:{product.id}"))
+                    code, name = payment_methods[i]
+                    keyboard[i // columns].append(InlineKeyboardButton(text=name, callback_data=f"pay:{code}:{product.id}"))
                 else:
                     keyboard[i // columns].append(InlineKeyboardButton(text="\u200b", callback_data="None"))
                 i += 1
     keyboard.append([InlineKeyboardButton(text="🏚 Главное меню", callback_data=f"main_menu")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def open_product(bot_username: str, product: Product):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛍️ Открыть в боте", url=f"https://t.me/{bot_username}?start=product_{product.id}")]
+    ])
+
 def buy_product(product: Product):
     keyboard = [
         [InlineKeyboardButton(text=f"💸 Купить - {product.price} рублей", callback_data=f"buy_product:{product.id}")],
@@ -50,11 +56,21 @@ def buy_product(product: Product):
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def buy_products(products: list[Product] = []):
+def navigation(page: Page, prefix: str) -> list[InlineKeyboardButton]:
+    row = []
+    if page.items and page.has_prev:
+        row.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}:before:{page.items[0].id}"))
+    if page.items and page.has_next:
+        row.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}:after:{page.items[-1].id}"))
+    return row
+
+def buy_products(page: Page, prefix: str = "products"):
     keyboard = [
         [InlineKeyboardButton(text=f"{product.name} - {product.price} рублей", callback_data=f"product_info:{product.id}")]
-        for product in products
+        for product in page.items
     ]
+    if row := navigation(page, prefix):
+        keyboard.append(row)
     keyboard.append(
         [InlineKeyboardButton(text="🏚 Главное меню", callback_data=f"main_menu")]
     )
@@ -1,16 +1,118 @@
 from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+import asyncio
+import signal
 
 from handlers.client import client_router
 from handlers.admin import admin_router
-from database.models import async_main
+from database.models import engine, async_main
+from payment.webhook import setup_heleket_webhook, settle_locally
+from payment.poller import poller
+from payment.invoices import invoices
+from broadcast import broadcaster
+from main.webhook import WebhookRequestHandler
+from main.workers import Supervisor, ShardMiddleware
+from catalog import catalog
+from search import search
+from http_client import http
+from rates import rate_cache
+from metrics import instrument, instrument_bot, setup_metrics
+from app_config.logger_config import logger
 from app_config import CONFIG
 
 
+async def start_web_app(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=CONFIG.get("WEB_HOST", "127.0.0.1"), port=CONFIG.get("WEB_PORT", 8080))
+    await site.start()
+    logger.info(f"Web server is listening on {site.name}")
+    return runner
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    await bot.set_webhook(
+        url=CONFIG["TELEGRAM_WEBHOOK_URL"],
+        secret_token=CONFIG.get("TELEGRAM_WEBHOOK_SECRET"),
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=CONFIG.get("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", 40)
+    )
+    logger.info(f"Receiving updates on {CONFIG['TELEGRAM_WEBHOOK_URL']}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
 async def main():
+    if CONFIG.get("USE_METRICS"):
+        instrument(engine, http)
     await async_main()
+    await search.sync()
+    supervisor = None
+    if CONFIG.get("WORKERS", 1) > 1:
+        supervisor = Supervisor(
+            workers=CONFIG["WORKERS"],
+            host=CONFIG.get("WORKER_HOST", "127.0.0.1"),
+            port=CONFIG.get("WORKER_PORT", 8081),
+            queue_size=CONFIG.get("WORKER_QUEUE_SIZE", 1000),
+            stop_timeout=CONFIG.get("WORKER_STOP_TIMEOUT", 30),
+            reply_timeout=CONFIG.get("WORKER_REPLY_TIMEOUT", 5)
+        )
+        await supervisor.start()
+    else:
+        await catalog.load()
+        await http.start()
+        if CONFIG["USE_HELEKET"]:
+            rate_cache.start()
     bot = Bot(token=CONFIG["BOT_TOKEN"])
     dp = Dispatcher()
     dp.include_router(client_router)
     dp.include_router(admin_router)
-    await dp.start_polling(bot)
+    if supervisor:
+        dp.update.outer_middleware(ShardMiddleware(supervisor))
+    if CONFIG.get("USE_METRICS"):
+        instrument_bot(dp, bot)
+
+    app = web.Application()
+    if CONFIG.get("USE_METRICS"):
+        setup_metrics(app, path=CONFIG.get("METRICS_PATH", "/metrics"))
+    if CONFIG["USE_HELEKET"] and CONFIG.get("USE_HELEKET_WEBHOOK"):
+        setup_heleket_webhook(app, settle=supervisor.settle if supervisor else settle_locally)
+    if CONFIG.get("USE_TELEGRAM_WEBHOOK"):
+        WebhookRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            concurrency=CONFIG.get("TELEGRAM_WEBHOOK_CONCURRENCY", 100),
+            drain_timeout=CONFIG.get("TELEGRAM_WEBHOOK_DRAIN_TIMEOUT", 30),
+            secret_token=CONFIG.get("TELEGRAM_WEBHOOK_SECRET")
+        ).register(app, path=CONFIG.get("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook"))
+        setup_application(app, dp, bot=bot)
 
+    runner = await start_web_app(app) if app.router.routes() else None
+    if not supervisor:
+        await invoices.start(bot)
+        await broadcaster.start(bot)
+    try:
+        if CONFIG.get("USE_TELEGRAM_WEBHOOK"):
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(
+                bot,
+                handle_as_tasks=supervisor is None,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+    finally:
+        if runner:
+            await runner.cleanup()
+        if supervisor:
+            await supervisor.stop()
+        else:
+            await broadcaster.stop()
+            await invoices.stop()
+            await poller.stop()
+        await rate_cache.stop()
+        await http.close()
@@ -0,0 +1,39 @@
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+import asyncio
+
+from app_config.logger_config import logger
+
+
+class WebhookRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, drain_timeout: float, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.drain_timeout = drain_timeout
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self.semaphore.acquire()
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except Exception:
+            self.semaphore.release()
+            raise
+
+        feed_update_task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(feed_update_task)
+        feed_update_task.add_done_callback(self._background_feed_update_tasks.discard)
+        feed_update_task.add_done_callback(lambda _: self.semaphore.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self):
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"Waiting for {len(pending)} updates to finish")
+            _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            if not_done:
+                logger.warning(f"{len(not_done)} updates did not finish in {self.drain_timeout}s")
+
+    async def close(self):
+        await self.drain()
+        await super().close()
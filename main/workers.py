@@ -0,0 +1,263 @@
+from typing import Any, Awaitable, Callable
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.types import Update
+from aiohttp import web
+import asyncio
+import itertools
+import multiprocessing
+import signal
+
+from handlers.client import client_router
+from handlers.admin import admin_router
+from middlewares import membership
+from database.models import engine
+from payment.poller import poller
+from payment.invoices import invoices
+from broadcast import broadcaster
+from catalog import catalog
+from search import search
+from cluster import cluster, shard_of, send, receive, STREAM_LIMIT
+from http_client import http
+from rates import rate_cache
+from metrics import instrument, instrument_bot, setup_metrics
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+def update_user_id(update: Update, data: dict[str, Any]) -> int | None:
+    member_updated = update.chat_member or update.my_chat_member
+    if member_updated is not None:
+        return member_updated.new_chat_member.user.id
+    user = data.get("event_from_user")
+    return user.id if user else None
+
+
+class WorkerLink:
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.connected = asyncio.Event()
+        self.writer: asyncio.StreamWriter | None = None
+        self.process: multiprocessing.Process | None = None
+
+
+class Supervisor:
+    def __init__(self, workers: int, host: str, port: int, queue_size: int, stop_timeout: float, reply_timeout: float):
+        self.host = host
+        self.port = port
+        self.stop_timeout = stop_timeout
+        self.reply_timeout = reply_timeout
+        self.replies: dict[int, asyncio.Future] = {}
+        self.request_ids = itertools.count()
+        self.links = [WorkerLink(index, queue_size) for index in range(workers)]
+        self.context = multiprocessing.get_context("spawn")
+        self.server: asyncio.Server | None = None
+        self.tasks: list[asyncio.Task] = []
+        self.stopping = False
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._accept, self.host, self.port, limit=STREAM_LIMIT)
+        for link in self.links:
+            self._spawn(link)
+        self.tasks = [asyncio.create_task(self._forward(link)) for link in self.links]
+        self.tasks.append(asyncio.create_task(self._watch()))
+        await asyncio.gather(*(link.connected.wait() for link in self.links))
+        logger.info(f"{len(self.links)} workers are running")
+
+    async def stop(self):
+        self.stopping = True
+        for link in self.links:
+            await link.queue.put({"type": "stop"})
+        await asyncio.gather(*(self._join(link) for link in self.links))
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.server.close()
+
+    async def route(self, update: Update, user_id: int | None):
+        link = self.links[shard_of(user_id, len(self.links)) if user_id is not None else 0]
+        await link.queue.put({
+            "type": "update",
+            "user_id": user_id,
+            "update": update.model_dump(mode="json", by_alias=True, exclude_none=True)
+        })
+
+    def publish(self, message: dict, exclude: WorkerLink | None = None):
+        for link in self.links:
+            if link is exclude:
+                continue
+            try:
+                link.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.warning(f"Worker {link.index} is overloaded, dropped {message['event']} event")
+
+    async def settle(self, provider: str, order_id: str) -> bool:
+        user_id = order_id.split("-", 1)[0]
+        if not user_id.isdigit():
+            return False
+        link = self.links[shard_of(int(user_id), len(self.links))]
+        request_id = next(self.request_ids)
+        self.replies[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            link.queue.put_nowait({"type": "event", "event": "settle", "provider": provider, "order_id": order_id, "request_id": request_id})
+            async with asyncio.timeout(self.reply_timeout):
+                return await self.replies[request_id]
+        except (asyncio.QueueFull, TimeoutError):
+            logger.warning(f"Worker {link.index} did not settle {provider} order {order_id}", extra={"order_id": order_id})
+            return False
+        finally:
+            self.replies.pop(request_id, None)
+
+    def _spawn(self, link: WorkerLink):
+        link.process = self.context.Process(
+            target=run_worker,
+            args=(link.index, len(self.links), self.host, self.port),
+            name=f"worker-{link.index}",
+            daemon=True
+        )
+        link.process.start()
+
+    async def _join(self, link: WorkerLink):
+        await asyncio.to_thread(link.process.join, self.stop_timeout)
+        if link.process.is_alive():
+            logger.warning(f"Worker {link.index} did not stop in {self.stop_timeout}s, killing it")
+            link.process.kill()
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = await receive(reader)
+        link = self.links[hello["index"]]
+        link.writer = writer
+        link.connected.set()
+        try:
+            while (message := await receive(reader)) is not None:
+                if message["type"] == "reply":
+                    future = self.replies.get(message["request_id"])
+                    if future is not None and not future.done():
+                        future.set_result(message["result"])
+                    continue
+                self.publish(message, exclude=link)
+        except ConnectionError:
+            pass
+        finally:
+            if link.writer is writer:
+                link.writer = None
+                link.connected.clear()
+            writer.close()
+
+    async def _forward(self, link: WorkerLink):
+        while True:
+            message = await link.queue.get()
+            await link.connected.wait()
+            try:
+                await send(link.writer, message)
+            except ConnectionError:
+                logger.error(f"Lost {message['type']} while worker {link.index} was restarting")
+
+    async def _watch(self):
+        while not self.stopping:
+            await asyncio.sleep(1)
+            for link in self.links:
+                if not self.stopping and not link.process.is_alive():
+                    logger.error(f"Worker {link.index} exited with code {link.process.exitcode}, restarting it")
+                    self._spawn(link)
+
+
+class ShardMiddleware(BaseMiddleware):
+    def __init__(self, supervisor: Supervisor):
+        self.supervisor = supervisor
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any]
+    ) -> Any:
+        await self.supervisor.route(event, update_user_id(event, data))
+
+
+def run_worker(index: int, workers: int, host: str, port: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(worker_main(index, workers, host, port))
+
+
+async def worker_main(index: int, workers: int, host: str, port: int):
+    if CONFIG.get("USE_METRICS"):
+        instrument(engine, http)
+    await catalog.load()
+    await http.start()
+    if CONFIG["USE_HELEKET"]:
+        rate_cache.start()
+    bot = Bot(token=CONFIG["BOT_TOKEN"])
+    dp = Dispatcher()
+    dp.include_router(client_router)
+    dp.include_router(admin_router)
+    runner = None
+    if CONFIG.get("USE_METRICS"):
+        instrument_bot(dp, bot)
+        app = web.Application()
+        setup_metrics(app, path=CONFIG.get("METRICS_PATH", "/metrics"))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host=CONFIG.get("WEB_HOST", "127.0.0.1"), port=CONFIG.get("METRICS_WORKER_PORT", 9100) + index).start()
+
+    async def settle(provider: str, order_id: str, request_id: int):
+        await cluster.reply(request_id, poller.settle(provider, order_id))
+
+    async def reload_catalog():
+        await catalog.load()
+        search.cache.clear()
+
+    async def invalidate_membership(user_id: int):
+        membership.invalidate(user_id)
+
+    cluster.on("catalog", reload_catalog)
+    cluster.on("membership", invalidate_membership)
+    cluster.on("settle", settle)
+
+    reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+    cluster.writer = writer
+    await send(writer, {"type": "hello", "index": index})
+    await invoices.start(bot, shard=index, shards=workers)
+    await broadcaster.start(bot, shard=index, shards=workers)
+
+    chains: dict[int | None, asyncio.Task] = {}
+
+    async def feed(previous: asyncio.Task | None, update: Update):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            logger.exception(f"Failed to process update {update.update_id}")
+
+    def release(user_id: int | None, task: asyncio.Task):
+        if chains.get(user_id) is task:
+            del chains[user_id]
+
+    try:
+        while (message := await receive(reader)) is not None:
+            if message["type"] == "stop":
+                break
+            if message["type"] == "event":
+                await cluster.dispatch(message)
+                continue
+
+            user_id = message["user_id"]
+            update = Update.model_validate(message["update"], context={"bot": bot})
+            task = asyncio.create_task(feed(chains.get(user_id), update))
+            chains[user_id] = task
+            task.add_done_callback(lambda task, user_id=user_id: release(user_id, task))
+    finally:
+        if chains:
+            await asyncio.wait(list(chains.values()))
+        cluster.writer = None
+        writer.close()
+        await broadcaster.stop()
+        await invoices.stop()
+        await poller.stop()
+        if runner:
+            await runner.cleanup()
+        await rate_cache.stop()
+        await http.close()
+        await bot.session.close()
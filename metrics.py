@@ -0,0 +1,232 @@
+from typing import Any, Awaitable, Callable
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web, TraceConfig
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+import asyncio
+import bisect
+import time
+
+from http_client import HttpClient
+
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        registry.metrics.append(self)
+
+    def key(self, labels: dict[str, Any]) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> list[str]:
+        return []
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+        self.function: Callable[[], dict[tuple, float]] | None = None
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+    def set_function(self, function: Callable[[], dict[tuple, float]]):
+        self.function = function
+
+    def samples(self) -> list[str]:
+        values = self.function() if self.function is not None else self.values
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0, 0.0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += 1
+        series[2] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, count, total) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_seconds = Histogram("bot_handler_seconds", "Time spent in update handlers", ("handler", "status"))
+telegram_request_seconds = Histogram("telegram_request_seconds", "Bot API request latency", ("method", "status"))
+http_request_seconds = Histogram("http_client_request_seconds", "Outbound HTTP request latency", ("endpoint", "status"))
+db_query_seconds = Histogram("db_query_seconds", "Database statement latency", ("operation",))
+event_loop_lag_seconds = Gauge("event_loop_lag_seconds", "How late the event loop woke up a periodic timer")
+invoices_pending = Gauge("invoices_pending", "Invoices currently polled", ("provider",))
+invoices_settled = Counter("invoices_settled_total", "Finished invoices", ("provider", "outcome"))
+invoice_jobs_queued = Gauge("invoice_jobs_queued", "Invoice jobs waiting for a worker")
+payment_provider_up = Gauge("payment_provider_up", "Whether the provider circuit breaker lets requests through", ("provider",))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+            handler_seconds.observe(time.perf_counter() - started, handler=name, status=status)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot: Bot, method):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await make_request(bot, method)
+            status = "ok"
+            return response
+        finally:
+            telegram_request_seconds.observe(time.perf_counter() - started, method=type(method).__name__, status=status)
+
+
+def trace_config() -> TraceConfig:
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        http_request_seconds.observe(
+            time.perf_counter() - context.started,
+            endpoint=f"{params.url.host}{params.url.path}",
+            status=params.response.status
+        )
+
+    async def on_request_exception(session, context, params):
+        http_request_seconds.observe(
+            time.perf_counter() - context.started,
+            endpoint=f"{params.url.host}{params.url.path}",
+            status=type(params.exception).__name__
+        )
+
+    config = TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    return config
+
+
+def instrument(engine: AsyncEngine, http: HttpClient):
+    http.trace_configs.append(trace_config())
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_query_seconds.observe(time.perf_counter() - started, operation=statement.split(None, 1)[0].upper())
+
+
+def instrument_bot(dp: Dispatcher, bot: Bot):
+    for observer in (dp.message, dp.callback_query, dp.inline_query, dp.chat_member):
+        observer.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(RequestMetricsMiddleware())
+
+
+async def monitor_event_loop(interval: float):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.set(max(time.perf_counter() - started - interval, 0))
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def setup_metrics(app: web.Application, path: str = "/metrics", lag_interval: float = 1.0):
+    app.router.add_get(path, metrics_handler)
+
+    async def start_monitor(app: web.Application):
+        task = asyncio.create_task(monitor_event_loop(lag_interval))
+        yield
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    app.cleanup_ctx.append(start_monitor)
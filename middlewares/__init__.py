@@ -0,0 +1,80 @@
+from typing import Any, Awaitable, Callable
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject, Message, CallbackQuery
+from aiogram.enums import ChatMemberStatus
+import time
+
+from app_config import CONFIG
+
+
+SUBSCRIBED_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR)
+
+
+class MembershipCache:
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.statuses: dict[int, tuple[bool, float]] = {}
+
+    def get(self, user_id: int) -> bool | None:
+        cached = self.statuses.get(user_id)
+        if cached is None:
+            return None
+        subscribed, expires_at = cached
+        if expires_at < time.monotonic():
+            del self.statuses[user_id]
+            return None
+        return subscribed
+
+    def set(self, user_id: int, subscribed: bool):
+        self.statuses[user_id] = (subscribed, time.monotonic() + (self.ttl if subscribed else self.negative_ttl))
+
+    def invalidate(self, user_id: int | None = None):
+        if user_id is None:
+            self.statuses.clear()
+        else:
+            self.statuses.pop(user_id, None)
+
+
+class SubscriptionMiddleware(BaseMiddleware):
+    def __init__(self, cache: MembershipCache):
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        mode = get_flag(data, "subscription")
+        if mode == "skip":
+            return await handler(event, data)
+
+        user = data["event_from_user"]
+        subscribed = self.cache.get(user.id)
+        if subscribed is None:
+            member = await data["bot"].get_chat_member(CONFIG["CHANNEL_ID"], user.id)
+            subscribed = member.status in SUBSCRIBED_STATUSES
+            self.cache.set(user.id, subscribed)
+
+        if mode == "optional":
+            data["subscribed"] = subscribed
+            return await handler(event, data)
+        if subscribed:
+            return await handler(event, data)
+
+        message = event if isinstance(event, Message) else event.message
+        await message.answer(subscribe_text(user.first_name))
+        if isinstance(event, CallbackQuery):
+            await event.answer()
+
+
+def subscribe_text(first_name: str) -> str:
+    return f"Добро пожаловать, {first_name}! Чтобы пользоваться ботом, необходимо подписаться на канал: {CONFIG['CHANNEL_USERNAME']}"
+
+
+membership = MembershipCache(
+    ttl=CONFIG.get("SUBSCRIPTION_CACHE_TTL", 300),
+    negative_ttl=CONFIG.get("SUBSCRIPTION_CACHE_NEGATIVE_TTL", 10)
+)
@@ -1,82 +1,138 @@
 from abc import abstractmethod, ABC
-from yoomoney import Quickpay, Client
-from aiohttp import ClientSession
+from urllib.parse import urlencode
 import asyncio
 import json
 import hashlib
 import base64
-from datetime import datetime
+import math
+import secrets
+from datetime import datetime, timedelta
 
 from database.models import Product, User
+from payment.reconciler import YooMoneyReconciler
 from app_config import CONFIG
+from http_client import http
+from health import health, ProviderError
+from rates import rate_cache
+from payment.registry import registry
 from utils import convert_crypto_to_rub, convert_time_to_readable
 
 
 class PaymentMethod(ABC):
     PAYMENT_ATTMEP_DELAY = 3
     PAYMENT_ATTEMPS = 100
+    CLOCK_SKEW = timedelta(seconds=CONFIG.get("PAYMENT_CLOCK_SKEW", 300))
+    def __init__(self, product: Product, user: User, order_id: str | None = None, created_at: datetime | None = None, payment_url: str | None = None):
+        self.created_at = created_at or datetime.now()
+        self.order_id = order_id or f"{user.id}-{product.id}-{self.created_at.strftime('%Y%m%d_%H%M%S')}-{secrets.token_hex(3)}"
+        self.product = product
+        self.user = user
+        self.payment_url = payment_url
+    @property
+    def expires_at(self) -> datetime:
+        return self.created_at + timedelta(seconds=self.PAYMENT_ATTEMPS * self.PAYMENT_ATTMEP_DELAY)
+    def payment_message(self) -> str:
+        remaining = math.ceil((self.expires_at - datetime.now()).total_seconds())
+        return (f"💵 Для оплаты {self.product.name}, перейдите по ссылке: {self.payment_url}\n"
+                f"⏰ У Вас есть {convert_time_to_readable(max(remaining, 0))}")
     @abstractmethod
     async def get_payment_message(self):
         pass
     @abstractmethod
     async def check_payment(self):
         pass
+    def forget(self):
+        pass
+    @classmethod
+    async def check_payments(cls, payments: list["PaymentMethod"]) -> set[str]:
+        results = await asyncio.gather(*(payment.check_payment() for payment in payments))
+        return {payment.order_id for payment, paid in zip(payments, results) if paid}
 
 
 if CONFIG["DEBUG_MODE"]:
     class TestPayment(PaymentMethod):
         name = "TestPayment"
+        provider = "test"
         PAYMENT_ATTMEP_DELAY = 3
         PAYMENT_ATTEMPS = 100
-        def __init__(self, product: Product, user: User):
-            self.product = product
-            self.user = user
         async def get_payment_message(self) -> str:
-            return (f"💵 Для оплаты {self.product.name}, перейдите по ссылке: https://www.youtube.com/watch?v=dQw4w9WgXcQ\n"
-                    f"⏰ У Вас есть {convert_time_to_readable(self.PAYMENT_ATTEMPS * self.PAYMENT_ATTMEP_DELAY)}")
+            self.payment_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+            return self.payment_message()
         async def check_payment(self) -> bool:
             return True
 
+    registry.add("t", TestPayment)
+
 if CONFIG["USE_YOOMONEY"]:
     class YooMoney(PaymentMethod):
         name = "ЮMoney"
-        client = Client(token=CONFIG["YOOMONEY_TOKEN"])
+        provider = "yoomoney"
         PAYMENT_ATTMEP_DELAY = 3
         PAYMENT_ATTEMPS = 100
-        def __init__(self, product: Product, user: User):
-            self.product = product
-            self.user = user
+        reconciler = YooMoneyReconciler(
+            CONFIG.get("YOOMONEY_API_URL", "https://yoomoney.ru/api/"),
+            CONFIG["YOOMONEY_TOKEN"],
+            max_age=timedelta(seconds=PAYMENT_ATTEMPS * PAYMENT_ATTMEP_DELAY + CONFIG.get("PAYMENT_POLL_GRACE", 600)) + PaymentMethod.CLOCK_SKEW
+        )
         async def get_payment_message(self) -> str:
-            quickpay = Quickpay(
-                receiver=CONFIG["YOOMONEY_WALLET"],
-                quickpay_form="shop",
-                targets="Sponsor this project",
-                paymentType="SB",
-                sum=self.product.price,
-                label=f"{self.user.id}:{self.product.id}"
-            )
-            return (f"💵 Для оплаты {self.product.name}, перейдите по ссылке: {quickpay.base_url}\n"
-                    f"⏰ У Вас есть {convert_time_to_readable(self.PAYMENT_ATTEMPS * self.PAYMENT_ATTMEP_DELAY)}")
+            self.payment_url = "https://yoomoney.ru/quickpay/confirm.xml?" + urlencode({
+                "receiver": CONFIG["YOOMONEY_WALLET"],
+                "quickpay-form": "shop",
+                "targets": "Sponsor this project",
+                "paymentType": "SB",
+                "sum": self.product.price,
+                "label": self.order_id
+            })
+            return self.payment_message()
         async def check_payment(self) -> bool:
-            history = self.client.operation_history()
-            for operation in history.operations:
-                if operation.label == f"{self.user.id}:{self.product.id}" and operation.amount >= (self.product.price * 0.9):
-                    return True
-            return False
+            return self.order_id in await self.check_payments([self])
+        def forget(self):
+            self.reconciler.forget(self.order_id)
+        @classmethod
+        async def check_payments(cls, payments: list[PaymentMethod]) -> set[str]:
+            await health.call(cls.provider, cls.reconciler.refresh, since=min(payment.created_at for payment in payments) - cls.CLOCK_SKEW)
+            paid = set()
+            for payment in payments:
+                amount = cls.reconciler.lookup(payment.order_id)
+                if amount is not None and amount >= (payment.product.price * 0.9):
+                    paid.add(payment.order_id)
+            return paid
+
+    registry.add("ym", YooMoney)
     
 
 if CONFIG["USE_HELEKET"]:
     class Heleket(PaymentMethod):
         name = "Heleket"
-        PAYMENT_ATTMEP_DELAY = 3
-        PAYMENT_ATTEMPS = 1200
-        def __init__(self, product: Product, user: User):
-            now = datetime.now()
-            date_str = now.strftime("%Y%m%d_%H%M%S")
+        provider = "heleket"
+        PAYMENT_ATTMEP_DELAY = 60 if CONFIG.get("USE_HELEKET_WEBHOOK") else 3
+        PAYMENT_ATTEMPS = 60 if CONFIG.get("USE_HELEKET_WEBHOOK") else 1200
+        INFO_MAX_PENDING = CONFIG.get("HELEKET_INFO_MAX_PENDING", 3)
+        @classmethod
+        async def request(cls, method: str, payload: dict, params: dict | None = None, idempotent: bool = True) -> dict:
+            return await health.call(cls.provider, cls._request, method, payload, params, idempotent)
+
+        @staticmethod
+        async def _request(method: str, payload: dict, params: dict | None = None, idempotent: bool = True) -> dict:
+            json_data = json.dumps(payload, separators=(',', ':'))
+            b64 = base64.b64encode(json_data.encode()).decode()
+            raw = b64 + CONFIG["HELEKET_API_KEY"]
+            sign = hashlib.md5(raw.encode()).hexdigest()
+            data = await http.post_json(
+                f"{CONFIG.get('HELEKET_API_URL', 'https://api.heleket.com')}/v1/{method}",
+                params=params,
+                headers={
+                    "merchant": CONFIG["HELEKET_MERCHANT_UUID"],
+                    "sign": sign,
+                    "Content-Type": "application/json"
+                },
+                data=json_data,
+                idempotent=idempotent
+            )
+            if not isinstance(data, dict) or data.get("state") != 0 or "result" not in data:
+                raise ProviderError(f"Heleket {method} error: {data}")
+            return data
 
-            self.order_id = f"{user.id}-{product.id}-{date_str}"
-            self.product = product
-            self.user = user
         async def get_payment_message(self) -> str:
             amount = await convert_crypto_to_rub(self.coin, self.product.price)
 
@@ -86,250 +142,67 @@ if CONFIG["USE_HELEKET"]:
                 "order_id": self.order_id,
                 "network": self.network
             }
-            json_data = json.dumps(payload)
-            async with ClientSession() as session:
-                sign_data = json_data.encode()
-                sign = hashlib.md5(base64.b64encode(sign_data) + CONFIG["HELEKET_API_KEY"].encode()).hexdigest()
-                async with session.post(
-                    "https://api.heleket.com/v1/payment",
-                    headers={
-                        "merchant": CONFIG["HELEKET_MERCHANT_UUID"],
-                        "sign": sign,
-                        "Content-Type": "application/json"
-                    },
-                    data=json_data
-                ) as response:
-                    data = await response.json()
+            if CONFIG.get("USE_HELEKET_WEBHOOK"):
+                payload["url_callback"] = CONFIG["HELEKET_WEBHOOK_URL"]
+            data = await self.request("payment", payload, idempotent=False)
 
-            return (f'💵 Для оплаты {self.product.name}, перейдите по ссылке: {data["result"]["url"]}\n'
-                    f"⏰ У Вас есть {convert_time_to_readable(self.PAYMENT_ATTEMPS * self.PAYMENT_ATTMEP_DELAY)}")
+            self.payment_url = data["result"]["url"]
+            return self.payment_message()
         
         async def check_payment(self) -> bool:
-            payload = {
-                "order_id": self.order_id
-            }
-            json_data = json.dumps(payload, separators=(',', ':'))
-            b64 = base64.b64encode(json_data.encode()).decode()
-            raw = b64 + CONFIG["HELEKET_API_KEY"]
-            sign = hashlib.md5(raw.encode()).hexdigest()
-            async with ClientSession() as session:
-                response = await session.post(
-                    "https://api.heleket.com/v1/payment/info",
-                    headers={
-                        "merchant": CONFIG["HELEKET_MERCHANT_UUID"],
-                        "sign": sign,
-                        "Content-Type": "application/json"
-                    },
-                    data=json_data
-                )
-                data = await response.json()
+            data = await self.request("payment/info", {"order_id": self.order_id})
 
             status = data["result"]["status"]
 
-            if status == "paid":
+            if status in ("paid", "paid_over"):
                 return True
             return False
-        
-        
-    class USDC_Arbitrum(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "arbitrum"
-        name = "USDC (arbitrum)"
-
-    class USDT_Arbitrum(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "arbitrum"
-        name = "USDT (arbitrum)"
-
-    class USDT_Avalanche(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "avalanche"
-        name = "USDT (avalanche)"
-
-    class USDC_Avalanche(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "avalanche"
-        name = "USDC (avalanche)"
-
-    class BCH_BCH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "BCH"
-        network = "bch"
-        name = "BCH (bch)"
 
-    class USDT_BSC(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "bsc"
-        name = "USDT (bsc)"
-
-    class DAI_BSC(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "DAI"
-        network = "bsc"
-        name = "DAI (bsc)"
-
-    class USDC_BSC(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "bsc"
-        name = "USDC (bsc)"
-
-    class CGPT_BSC(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "CGPT"
-        network = "bsc"
-        name = "CGPT (bsc)"
-
-    class DASH_DASH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "DASH"
-        network = "dash"
-        name = "DASH (dash)"
-
-    class DOGE_DOGE(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "DOGE"
-        network = "doge"
-        name = "DOGE (doge)"
-
-    class SHIB_ETH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "SHIB"
-        network = "eth"
-        name = "SHIB (eth)"
-
-    class VERSE_ETH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "VERSE"
-        network = "eth"
-        name = "VERSE (eth)"
-
-    class USDT_ETH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "eth"
-        name = "USDT (eth)"
-
-    class USDC_ETH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "eth"
-        name = "USDC (eth)"
-
-    class DAI_ETH(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "DAI"
-        network = "eth"
-        name = "DAI (eth)"
-
-    class POL_Polygon(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "POL"
-        network = "polygon"
-        name = "POL (polygon)"
-
-    class USDT_Polygon(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "polygon"
-        name = "USDT (polygon)"
-
-    class USDC_Polygon(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "polygon"
-        name = "USDC (polygon)"
-
-    class DAI_Polygon(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "DAI"
-        network = "polygon"
-        name = "DAI (polygon)"
-
-    class USDT_SOL(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "sol"
-        name = "USDT (sol)"
-
-    class SOL_SOL(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "SOL"
-        network = "sol"
-        name = "SOL (sol)"
-
-    class TON_TON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "TON"
-        network = "ton"
-        name = "TON (ton)"
-
-    class HMSTR_TON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "HMSTR"
-        network = "ton"
-        name = "HMSTR (ton)"
-
-    class USDT_TON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "ton"
-        name = "USDT (ton)"
-
-    class TRX_TRON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "TRX"
-        network = "tron"
-        name = "TRX (tron)"
-
-    class USDT_TRON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDT"
-        network = "tron"
-        name = "USDT (tron)"
-
-    class USDC_TRON(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "USDC"
-        network = "tron"
-        name = "USDC (tron)"
+        @classmethod
+        async def check_payments(cls, payments: list[PaymentMethod]) -> set[str]:
+            if len(payments) <= cls.INFO_MAX_PENDING:
+                return await super().check_payments(payments)
+            pending = {payment.order_id: payment for payment in payments}
+            date_from = min(payment.created_at for payment in payments) - cls.CLOCK_SKEW
+            paid = set()
+            seen = set()
+            cursor = None
+            while True:
+                data = await cls.request(
+                    "payment/list",
+                    {"date_from": date_from.strftime("%Y-%m-%d %H:%M:%S")},
+                    params={"cursor": cursor} if cursor else None
+                )
 
-    class XMR_XMR(Heleket):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        coin = "XMR"
-        network = "xmr"
-        name = "XMR (xmr)"
\ No newline at end of file
+                for item in data["result"]["items"]:
+                    if item["order_id"] in pending:
+                        seen.add(item["order_id"])
+                        if item["status"] in ("paid", "paid_over"):
+                            paid.add(item["order_id"])
+
+                cursor = data["result"]["paginate"]["nextCursor"]
+                if not cursor or len(seen) == len(pending):
+                    break
+
+            missing = [payment for order_id, payment in pending.items() if order_id not in seen]
+            if missing:
+                paid |= await super().check_payments(missing)
+            return paid
+
+    registry.add_group("hk", Heleket.name)
+
+    for network, coins in CONFIG.get("HELEKET_COINS", {}).items():
+        parent = "hk"
+        if len(coins) > 1:
+            parent = f"hk.{network}"
+            registry.add_group(parent, network, parent="hk")
+        for coin in coins:
+            payment_method = type(f"{coin}_{network}", (Heleket,), {
+                "coin": coin,
+                "network": network,
+                "name": f"{coin} ({network})",
+                "__module__": __name__
+            })
+            registry.add(f"{coin.lower()}.{network}", payment_method, parent=parent)
+
+    rate_cache.track({payment_method.coin for payment_method in registry.methods.values() if issubclass(payment_method, Heleket)})
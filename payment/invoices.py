@@ -0,0 +1,219 @@
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from datetime import datetime, timedelta
+import asyncio
+import itertools
+import weakref
+
+import keyboards.client as kb
+from payment import PaymentMethod
+from payment.poller import poller
+from payment.registry import registry
+from database.models import Invoice, User
+from database.requests import create_invoice, get_pending_invoices, set_invoice_status, set_invoice_message, complete_invoice, detach_user_invoices
+from catalog import catalog
+from metrics import invoices_settled, invoice_jobs_queued
+from cluster import shard_of
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+class InvoiceQueue:
+    def __init__(self, workers: int, reuse_min_ttl: float):
+        self.workers = workers
+        self.reuse_min_ttl = timedelta(seconds=reuse_min_ttl)
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        self.watching: dict[int, asyncio.Future] = {}
+        self.open_invoices: dict[tuple[int, int, str], Invoice] = {}
+        self.locks: weakref.WeakValueDictionary[tuple[int, int, str], asyncio.Lock] = weakref.WeakValueDictionary()
+        self.tasks: list[asyncio.Task] = []
+        self.bot: Bot | None = None
+
+    async def start(self, bot: Bot, shard: int = 0, shards: int = 1):
+        self.bot = bot
+        pending = [invoice for invoice in await get_pending_invoices() if shard_of(invoice.user_id, shards) == shard]
+        self.open_invoices = {}
+        for invoice in pending:
+            self.open_invoices[self._key(invoice.user_id, invoice.product_id, invoice.method)] = invoice
+            self._submit(invoice.expires_at.timestamp(), self._watch, invoice)
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if pending:
+            logger.info(f"Resuming {len(pending)} pending invoices")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for future in list(self.watching.values()):
+            future.cancel()
+
+    async def open(self, payment: PaymentMethod, chat_id: int, message_id: int) -> Invoice:
+        invoice = await create_invoice(
+            order_id=payment.order_id,
+            provider=payment.provider,
+            method=payment.name,
+            user_id=payment.user.id,
+            product_id=payment.product.id,
+            chat_id=chat_id,
+            message_id=message_id,
+            payment_url=payment.payment_url,
+            created_at=payment.created_at,
+            expires_at=payment.expires_at,
+            status="pending"
+        )
+        self.open_invoices[self._key(invoice.user_id, invoice.product_id, invoice.method)] = invoice
+        self._submit(invoice.expires_at.timestamp(), self._watch, invoice)
+        return invoice
+
+    def lock(self, user_id: int, product_id: int, method: str) -> asyncio.Lock:
+        return self.locks.setdefault(self._key(user_id, product_id, method), asyncio.Lock())
+
+    def find_open(self, user_id: int, product_id: int, method: str) -> Invoice | None:
+        invoice = self.open_invoices.get(self._key(user_id, product_id, method))
+        if invoice is None or invoice.payment_url is None:
+            return None
+        min_ttl = min(self.reuse_min_ttl, (invoice.expires_at - invoice.created_at) / 2)
+        if invoice.expires_at - datetime.now() < min_ttl:
+            return None
+        return invoice
+
+    async def attach(self, invoice: Invoice, chat_id: int, message_id: int):
+        previous_chat_id, previous_message_id = invoice.chat_id, invoice.message_id
+        invoice.chat_id, invoice.message_id = chat_id, message_id
+        await set_invoice_message(invoice.id, chat_id, message_id)
+        if previous_message_id:
+            try:
+                await self.bot.delete_message(previous_chat_id, previous_message_id)
+            except TelegramBadRequest:
+                pass
+
+    async def detach_user(self, user_id: int):
+        invoices = [invoice for key, invoice in self.open_invoices.items() if key[0] == user_id]
+        if any(invoice.message_id for invoice in invoices):
+            for invoice in invoices:
+                invoice.message_id = None
+            await detach_user_invoices(user_id)
+
+    async def cancel_message(self, user_id: int, message_id: int):
+        for invoice in [invoice for key, invoice in self.open_invoices.items() if key[0] == user_id and invoice.message_id == message_id]:
+            invoice.status = "cancelled"
+            self._forget(invoice)
+            await set_invoice_status(invoice.id, "cancelled")
+            future = self.watching.get(invoice.id)
+            if future is not None:
+                future.cancel()
+
+    async def expire_product(self, product_id: int):
+        for invoice in [invoice for key, invoice in self.open_invoices.items() if key[1] == product_id]:
+            invoice.status = "expired"
+            self._forget(invoice)
+            future = self.watching.get(invoice.id)
+            if future is not None:
+                future.cancel()
+            if invoice.message_id:
+                try:
+                    await self.bot.delete_message(invoice.chat_id, invoice.message_id)
+                except TelegramBadRequest:
+                    pass
+
+    def _submit(self, priority: float, job, invoice: Invoice, *args):
+        self.queue.put_nowait((priority, next(self.counter), job, invoice, args))
+
+    async def _work(self):
+        while True:
+            _, _, job, invoice, args = await self.queue.get()
+            try:
+                await job(invoice, *args)
+            except Exception:
+                logger.exception(f"Failed to process invoice {invoice.order_id}", extra={"order_id": invoice.order_id})
+            finally:
+                self.queue.task_done()
+
+    async def _watch(self, invoice: Invoice):
+        if invoice.status != "pending":
+            return
+        product = catalog.get(invoice.product_id)
+        payment_method = registry.by_name.get(invoice.method)
+        if product is None or payment_method is None:
+            self._forget(invoice)
+            logger.warning(
+                f"Dropping invoice {invoice.order_id}: {invoice.method} or product {invoice.product_id} is gone",
+                extra={"user_id": invoice.user_id, "product_id": invoice.product_id, "order_id": invoice.order_id}
+            )
+            await set_invoice_status(invoice.id, "cancelled")
+            return
+
+        payment = payment_method(
+            product=product,
+            user=User(id=invoice.user_id),
+            order_id=invoice.order_id,
+            created_at=invoice.created_at
+        )
+        future = poller.watch(payment)
+        self.watching[invoice.id] = future
+        future.add_done_callback(lambda _: self._on_done(invoice, future))
+
+    def _on_done(self, invoice: Invoice, future: asyncio.Future):
+        if self.watching.get(invoice.id) is future:
+            del self.watching[invoice.id]
+        if not future.cancelled():
+            self._submit(0, self._finish, invoice, future.result())
+
+    def _forget(self, invoice: Invoice):
+        key = self._key(invoice.user_id, invoice.product_id, invoice.method)
+        if self.open_invoices.get(key) is invoice:
+            del self.open_invoices[key]
+
+    @staticmethod
+    def _key(user_id: int, product_id: int, method: str) -> tuple[int, int, str]:
+        return user_id, int(product_id), method
+
+    async def _finish(self, invoice: Invoice, paid: bool):
+        self._forget(invoice)
+        invoices_settled.inc(provider=invoice.provider, outcome="paid" if paid else "expired")
+        product = catalog.get(invoice.product_id)
+        granted = False
+        if paid:
+            granted = await complete_invoice(invoice)
+            if granted:
+                logger.info(
+                    f"User {invoice.user_id} has bought {product.name if product else invoice.product_id} ({invoice.order_id})",
+                    extra={"user_id": invoice.user_id, "product_id": invoice.product_id, "order_id": invoice.order_id}
+                )
+            else:
+                logger.warning(
+                    f"User {invoice.user_id} has paid {invoice.order_id} for deleted product {invoice.product_id}, nothing was granted",
+                    extra={"user_id": invoice.user_id, "product_id": invoice.product_id, "order_id": invoice.order_id}
+                )
+        else:
+            await set_invoice_status(invoice.id, "expired")
+
+        if invoice.message_id:
+            try:
+                await self.bot.delete_message(invoice.chat_id, invoice.message_id)
+            except TelegramBadRequest:
+                pass
+
+        if granted:
+            await self.bot.send_message(
+                invoice.chat_id,
+                "✅ Оплата прошла успешно! Скачать товар можно, по кнопке ⬇️ или во вкладке 🛒 Мои покупки!",
+                reply_markup=kb.get_file(product) if product else kb.return_to_main_menu
+            )
+        elif paid:
+            await self.bot.send_message(
+                invoice.chat_id,
+                "⚠️ Оплата получена, но этот товар уже удален из магазина. Напиши администратору!",
+                reply_markup=kb.return_to_main_menu
+            )
+        else:
+            await self.bot.send_message(invoice.chat_id, "⚠️ Не смогли найти твою оплату!", reply_markup=kb.return_to_main_menu)
+
+
+invoices = InvoiceQueue(
+    workers=CONFIG.get("INVOICE_WORKERS", 4),
+    reuse_min_ttl=CONFIG.get("INVOICE_REUSE_MIN_TTL", 300)
+)
+invoice_jobs_queued.set_function(lambda: {(): invoices.queue.qsize()})
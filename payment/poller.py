@@ -0,0 +1,110 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from payment import PaymentMethod
+from metrics import invoices_pending
+from health import health, ProviderError, ProviderUnavailable
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+@dataclass
+class PendingInvoice:
+    payment: PaymentMethod
+    future: asyncio.Future
+    deadline: float
+
+
+class PaymentPoller:
+    def __init__(self, max_delay: float, backoff: float, concurrency: int, grace: float):
+        self.max_delay = max_delay
+        self.grace = grace
+        self.backoff = backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending: dict[str, dict[str, PendingInvoice]] = {}
+        self.delays: dict[str, float] = {}
+        self.loops: dict[str, asyncio.Task] = {}
+
+    def watch(self, payment: PaymentMethod) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        invoice = PendingInvoice(
+            payment=payment,
+            future=future,
+            deadline=time.monotonic() + (payment.expires_at - datetime.now()).total_seconds()
+        )
+        self.pending.setdefault(payment.provider, {})[payment.order_id] = invoice
+        future.add_done_callback(lambda _: self._discard(invoice))
+        self.delays[payment.provider] = payment.PAYMENT_ATTMEP_DELAY
+        if payment.provider not in self.loops or self.loops[payment.provider].done():
+            self.loops[payment.provider] = asyncio.create_task(self._poll(payment.provider))
+        return future
+
+    async def stop(self):
+        loops = list(self.loops.values())
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        self.loops = {}
+
+    def settle(self, provider: str, order_id: str) -> bool:
+        invoice = self.pending.get(provider, {}).get(order_id)
+        if invoice is None or invoice.future.done():
+            return False
+        invoice.future.set_result(True)
+        self.delays[provider] = invoice.payment.PAYMENT_ATTMEP_DELAY
+        return True
+
+    def _discard(self, invoice: PendingInvoice):
+        invoices = self.pending.get(invoice.payment.provider, {})
+        if invoices.get(invoice.payment.order_id) is invoice:
+            del invoices[invoice.payment.order_id]
+            invoice.payment.forget()
+
+    def _expire(self, provider: str, grace: float = 0):
+        now = time.monotonic()
+        for invoice in list(self.pending[provider].values()):
+            if invoice.deadline + grace <= now and not invoice.future.done():
+                invoice.future.set_result(False)
+
+    async def _poll(self, provider: str):
+        while self.pending.get(provider):
+            await asyncio.sleep(self.delays[provider])
+            invoices = list(self.pending[provider].values())
+            if not invoices:
+                break
+
+            payment_method = type(invoices[0].payment)
+            max_delay = max(self.max_delay, payment_method.PAYMENT_ATTMEP_DELAY)
+            try:
+                async with self.semaphore:
+                    paid = await payment_method.check_payments([invoice.payment for invoice in invoices])
+            except (ProviderUnavailable, ProviderError) as e:
+                logger.warning(f"Failed to check {len(invoices)} {provider} payments: {e}")
+                paid = None
+            except Exception:
+                logger.exception(f"Failed to check {len(invoices)} {provider} payments")
+                paid = None
+
+            if paid is None:
+                self._expire(provider, grace=self.grace)
+                self.delays[provider] = max(min(self.delays[provider] * self.backoff, max_delay), health.retry_in(provider))
+                continue
+
+            settled = [order_id for order_id in paid if self.settle(provider, order_id)]
+            self._expire(provider)
+            if not settled:
+                self.delays[provider] = min(self.delays[provider] * self.backoff, max_delay)
+
+        self.loops.pop(provider, None)
+
+
+poller = PaymentPoller(
+    max_delay=CONFIG.get("PAYMENT_POLL_MAX_DELAY", 15),
+    backoff=CONFIG.get("PAYMENT_POLL_BACKOFF", 1.5),
+    concurrency=CONFIG.get("PAYMENT_POLL_CONCURRENCY", 4),
+    grace=CONFIG.get("PAYMENT_POLL_GRACE", 600)
+)
+
+invoices_pending.set_function(lambda: {(provider,): len(invoices) for provider, invoices in poller.pending.items()})
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from http_client import http
+from health import ProviderError
+
+
+class YooMoneyReconciler:
+    def __init__(self, api_url: str, token: str, max_age: timedelta, records: int = 100):
+        self.api_url = api_url
+        self.token = token
+        self.max_age = max_age
+        self.records = records
+        self.amounts: dict[str, tuple[float, datetime]] = {}
+        self.last_seen: datetime | None = None
+        self.last_seen_ids: set[str] = set()
+        self.lock = asyncio.Lock()
+
+    def lookup(self, label: str) -> float | None:
+        amount = self.amounts.get(label)
+        return amount[0] if amount else None
+
+    def forget(self, label: str):
+        self.amounts.pop(label, None)
+
+    async def refresh(self, since: datetime):
+        async with self.lock:
+            operations = await self._fetch(self.last_seen or since)
+            for operation in operations:
+                if operation["operation_id"] in self.last_seen_ids:
+                    continue
+                if operation.get("label") and operation.get("status") == "success":
+                    amount = self.lookup(operation["label"]) or 0
+                    self.amounts[operation["label"]] = (max(amount, operation["amount"]), operation["datetime"])
+                if self.last_seen is None or operation["datetime"] > self.last_seen:
+                    self.last_seen = operation["datetime"]
+                    self.last_seen_ids = set()
+                if operation["datetime"] == self.last_seen:
+                    self.last_seen_ids.add(operation["operation_id"])
+            stale = datetime.now() - self.max_age
+            for label in [label for label, (_, paid_at) in self.amounts.items() if paid_at < stale]:
+                del self.amounts[label]
+
+    async def _fetch(self, from_date: datetime) -> list[dict]:
+        operations = []
+        form = {"type": "deposition", "from": from_date.astimezone().isoformat(timespec="seconds"), "records": str(self.records)}
+        while True:
+            data = await http.post_json(
+                f"{self.api_url}operation-history",
+                headers={"Authorization": f"Bearer {self.token}"},
+                data=form,
+                idempotent=True
+            )
+            if not isinstance(data, dict) or "error" in data or not isinstance(data.get("operations"), list):
+                raise ProviderError(f"YooMoney operation-history error: {data}")
+            for operation in data["operations"]:
+                operation["datetime"] = datetime.fromisoformat(operation["datetime"]).astimezone().replace(tzinfo=None)
+                operations.append(operation)
+            if not data.get("next_record"):
+                return sorted(operations, key=lambda operation: operation["datetime"])
+            form["start_record"] = data["next_record"]
@@ -0,0 +1,37 @@
+from health import health
+
+
+class PaymentRegistry:
+    def __init__(self):
+        self.methods: dict[str, type] = {}
+        self.by_name: dict[str, type] = {}
+        self.names: dict[str, str] = {}
+        self.groups: dict[str | None, list[str]] = {None: []}
+
+    def add(self, code: str, method: type, parent: str | None = None):
+        self.methods[code] = method
+        self.by_name[method.name] = method
+        self.names[code] = method.name
+        self.groups[parent].append(code)
+
+    def add_group(self, code: str, name: str, parent: str | None = None):
+        self.names[code] = name
+        self.groups[code] = []
+        self.groups[parent].append(code)
+
+    def get(self, code: str) -> type | None:
+        return self.methods.get(code)
+
+    def is_group(self, code: str) -> bool:
+        return code in self.groups
+
+    def available(self, code: str) -> bool:
+        if code in self.groups:
+            return any(self.available(child) for child in self.groups[code])
+        return health.available(self.methods[code].provider)
+
+    def options(self, group: str | None = None) -> list[tuple[str, str]]:
+        return [(code, self.names[code]) for code in self.groups.get(group, []) if self.available(code)]
+
+
+registry = PaymentRegistry()
@@ -0,0 +1,44 @@
+from typing import Awaitable, Callable
+from aiohttp import web
+import functools
+import json
+import hashlib
+import hmac
+import base64
+
+from payment.poller import poller
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+def sign_payload(data: dict) -> str:
+    json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace('/', '\\/')
+    return hashlib.md5(base64.b64encode(json_data.encode()) + CONFIG["HELEKET_API_KEY"].encode()).hexdigest()
+
+
+async def settle_locally(provider: str, order_id: str) -> bool:
+    return poller.settle(provider, order_id)
+
+
+async def heleket_webhook(request: web.Request, settle: Callable[[str, str], Awaitable[bool]]) -> web.Response:
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    sign = data.pop("sign", None) if isinstance(data, dict) else None
+    if not sign or not hmac.compare_digest(sign, sign_payload(data)):
+        logger.warning(f"Rejected Heleket webhook from {request.remote}: bad sign")
+        return web.Response(status=403)
+
+    if data.get("type") == "payment" and data.get("status") in ("paid", "paid_over"):
+        order_id = data.get("order_id")
+        if not order_id:
+            logger.warning(f"Ignored Heleket webhook without order_id: {data}")
+        elif await settle("heleket", order_id):
+            logger.info(f"Heleket order {order_id} has been paid (webhook)", extra={"order_id": order_id})
+    return web.Response(text="ok")
+
+
+def setup_heleket_webhook(app: web.Application, settle: Callable[[str, str], Awaitable[bool]] = settle_locally):
+    app.router.add_post(CONFIG.get("HELEKET_WEBHOOK_PATH", "/heleket/webhook"), functools.partial(heleket_webhook, settle=settle))
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from http_client import http
+from health import health, ProviderError
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+class RateCache:
+    def __init__(self, ttl: float, max_stale: float, currency: str = "RUB"):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.currency = currency
+        self.coins: set[str] = set()
+        self.rates: dict[str, tuple[float, float]] = {}
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.task: asyncio.Task | None = None
+
+    def track(self, coins: set[str]):
+        self.coins.update(coins)
+
+    async def get(self, coin: str) -> float:
+        cached = self.rates.get(coin)
+        if cached is not None and time.monotonic() - cached[1] <= self.max_stale:
+            return cached[0]
+        return await self._load(coin)
+
+    async def refresh(self):
+        coins = list(self.coins)
+        results = await asyncio.gather(*(self._load(coin) for coin in coins), return_exceptions=True)
+        for coin, result in zip(coins, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to refresh {coin} rate: {result!r}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._refresh_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _refresh_forever(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.ttl)
+
+    async def _load(self, coin: str) -> float:
+        if coin not in self.inflight:
+            self.inflight[coin] = asyncio.create_task(self._fetch(coin))
+            self.inflight[coin].add_done_callback(lambda _: self.inflight.pop(coin, None))
+        return await asyncio.shield(self.inflight[coin])
+
+    async def _fetch(self, coin: str) -> float:
+        data = await health.call("heleket", self._request, coin)
+        for result in data["result"]:
+            if result["to"] == self.currency:
+                course = float(result["course"])
+                self.rates[coin] = (course, time.monotonic())
+                return course
+        raise ProviderError(f"No {coin} to {self.currency} rate")
+
+    async def _request(self, coin: str) -> dict:
+        data = await http.get_json(f"{CONFIG.get('HELEKET_API_URL', 'https://api.heleket.com')}/v1/exchange-rate/{coin}/list")
+        if not isinstance(data, dict) or data.get("state") != 0 or not isinstance(data.get("result"), list):
+            raise ProviderError(f"Heleket exchange-rate error for {coin}: {data}")
+        return data
+
+
+rate_cache = RateCache(
+    ttl=CONFIG.get("RATES_TTL", 60),
+    max_stale=CONFIG.get("RATES_MAX_STALE", 600)
+)
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from sqlalchemy import select, text
+import aiofiles
+import re
+
+from database.models import engine, async_session, Product
+from app_config.logger_config import logger
+from app_config import CONFIG
+
+
+class ProductSearch:
+    def __init__(self, cache_size: int, limit: int = 50):
+        self.cache_size = cache_size
+        self.limit = limit
+        self.cache: OrderedDict[str, list[int]] = OrderedDict()
+        self.fts = engine.dialect.name == "sqlite"
+
+    async def sync(self):
+        if not self.fts:
+            return
+        async with async_session() as session:
+            indexed = set(await session.scalars(text("SELECT rowid FROM products_fts")))
+            products = (await session.scalars(select(Product))).all()
+            for product in products:
+                if product.id not in indexed:
+                    await self._insert(session, product, await self._read_description(product))
+            for product_id in indexed - {product.id for product in products}:
+                await session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {"id": product_id})
+            await session.commit()
+        self.cache.clear()
+
+    async def index(self, product: Product, description: str):
+        if self.fts:
+            async with async_session() as session:
+                await session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {"id": product.id})
+                await self._insert(session, product, description)
+                await session.commit()
+        self.cache.clear()
+
+    async def remove(self, product_id: int | str):
+        if self.fts:
+            async with async_session() as session:
+                await session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {"id": int(product_id)})
+                await session.commit()
+        self.cache.clear()
+
+    async def search(self, query: str) -> list[int]:
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        key = " ".join(terms)
+        product_ids = self.cache.get(key)
+        if product_ids is not None:
+            self.cache.move_to_end(key)
+            return product_ids
+
+        async with async_session() as session:
+            if self.fts:
+                product_ids = list(await session.scalars(
+                    text("SELECT rowid FROM products_fts WHERE products_fts MATCH :match ORDER BY bm25(products_fts, 10.0, 1.0) LIMIT :limit"),
+                    {"match": " ".join(f'"{term}"*' for term in terms), "limit": self.limit}
+                ))
+            else:
+                product_ids = list(await session.scalars(
+                    select(Product.id).where(*(Product.name.ilike(f"%{term}%") for term in terms)).order_by(Product.id).limit(self.limit)
+                ))
+
+        self.cache[key] = product_ids
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return product_ids
+
+    async def _insert(self, session, product: Product, description: str):
+        await session.execute(
+            text("INSERT INTO products_fts(rowid, name, description) VALUES (:id, :name, :description)"),
+            {"id": product.id, "name": product.name, "description": description}
+        )
+
+    async def _read_description(self, product: Product) -> str:
+        try:
+            async with aiofiles.open(product.description_path, 'r', encoding='utf-8') as description_file:
+                return await description_file.read()
+        except OSError:
+            logger.warning(f"Description of {product.name} is missing, indexing its name only")
+            return ""
+
+
+search = ProductSearch(cache_size=CONFIG.get("SEARCH_CACHE_SIZE", 256))
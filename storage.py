@@ -0,0 +1,68 @@
+from typing import AsyncIterator
+from aiogram import Bot
+import aiofiles
+import aiofiles.os
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+
+from app_config import CONFIG
+
+
+class ProductStorage:
+    def __init__(self, root: str, chunk_size: int = 65536, download_timeout: int = 300):
+        self.root = root
+        self.blobs = os.path.join(root, "blobs")
+        self.tmp = os.path.join(root, "tmp")
+        self.chunk_size = chunk_size
+        self.download_timeout = download_timeout
+
+    async def save_upload(self, bot: Bot, file_id: str, suffix: str | None = None) -> str:
+        file = await bot.get_file(file_id)
+        if suffix is None:
+            suffix = os.path.splitext(file.file_path or "")[1]
+        chunks = bot.session.stream_content(
+            url=bot.session.api.file_url(bot.token, file.file_path),
+            timeout=self.download_timeout,
+            chunk_size=self.chunk_size,
+            raise_for_status=True
+        )
+        return await self._store(chunks, suffix)
+
+    async def save_text(self, content: str, suffix: str = ".txt") -> str:
+        async def chunks():
+            yield content.encode('utf-8')
+        return await self._store(chunks(), suffix)
+
+    async def remove(self, path: str):
+        if await aiofiles.os.path.exists(path):
+            await aiofiles.os.remove(path)
+
+    async def remove_tree(self, path: str):
+        await asyncio.to_thread(shutil.rmtree, path, True)
+
+    async def _store(self, chunks: AsyncIterator[bytes], suffix: str) -> str:
+        await aiofiles.os.makedirs(self.tmp, exist_ok=True)
+        await aiofiles.os.makedirs(self.blobs, exist_ok=True)
+        tmp_path = os.path.join(self.tmp, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as tmp_file:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    await tmp_file.write(chunk)
+
+            path = os.path.join(self.blobs, digest.hexdigest() + suffix)
+            if await aiofiles.os.path.exists(path):
+                await aiofiles.os.remove(tmp_path)
+            else:
+                await aiofiles.os.replace(tmp_path, path)
+            return path
+        except BaseException:
+            await self.remove(tmp_path)
+            raise
+
+
+storage = ProductStorage(root=CONFIG.get("PRODUCTS_DIR", "products"))
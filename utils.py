@@ -1,14 +1,12 @@
-from aiohttp import ClientSession
 import humanize
 import datetime
 
+from rates import rate_cache
 
-def get_all_subclasses(cls) -> list:
-    subclasses = []
-    for subclass in cls.__subclasses__():
-        subclasses.append(subclass)
-        subclasses.extend(get_all_subclasses(subclass))
-    return subclasses
+
+def parse_cursor(callback_data: str) -> dict[str, int]:
+    _, direction, key = callback_data.split(':')
+    return {direction: int(key)}
 
 
 def convert_time_to_readable(seconds: int) -> str:
@@ -17,11 +15,5 @@ def convert_time_to_readable(seconds: int) -> str:
 
 
 async def convert_crypto_to_rub(currency_name: str, amount: int | float) -> int | float:
-    async with ClientSession() as session:
-        response = await session.get(f"https://api.heleket.com/v1/exchange-rate/{currency_name}/list")
-        data = await response.json()
-
-    for result in data["result"]:
-        if result["to"] == "RUB":
-            return round(amount / float(result["course"]), 6)
+    return round(amount / await rate_cache.get(currency_name), 6)
         
\ No newline at end of file